@@ -0,0 +1,202 @@
+# coding: utf-8
+
+"""
+Coarse-to-fine sampling of a turntable grid. Sampling starts with every `coarse`-th point of the grid, a cell
+out of error_target is split and its edge midpoints and center are sampled next, until every cell is within
+target, is one grid step wide, or the position budget is used up.
+
+Error of a cell is the worst interpolation error seen at its corners, i.e. how far the value measured at a
+midpoint is from interpolating its parent corners, so smooth regions stop early even when values change fast.
+Cells without sampled midpoints yet fall back to the largest difference between their corners.
+
+The sampler is a position stream driven by feedback: the collect loop must `add` the data of a position
+before asking for the next one.
+"""
+
+import heapq
+from collections import namedtuple
+from typing import Iterator, Optional
+
+import numpy as np
+
+from motion import parse_grid, order_nearest
+
+import logging
+logger = logging.getLogger(__name__)
+
+# value(data) -> vector of one position, distance(a, b) -> how much two positions differ,
+# mean(values) -> interpolation between positions.
+Metric = namedtuple("Metric", ["value", "distance", "mean"])
+
+
+def _wrap_phase(deg):
+    return (np.asarray(deg) + 180.0) % 360.0 - 180.0
+
+
+def ant_calib_value(records) -> Optional[np.ndarray]:
+    """Per-channel phase relative to channel 0, averaged over lines of one response."""
+    if records is None or not len(records):
+        return None
+    relative = np.radians(records["values"] - records["values"][:, :1])
+    return np.degrees(np.angle(np.exp(1j * relative).mean(axis=0)))
+
+
+def phase_distance(a, b) -> float:
+    return float(np.nanmax(np.abs(_wrap_phase(a - b))))
+
+
+def phase_mean(values) -> np.ndarray:
+    return np.degrees(np.angle(np.exp(1j * np.radians(np.stack(values))).mean(axis=0)))
+
+
+def akbk_value(frames) -> Optional[np.ndarray]:
+    """Mean rng/vel/ang of ak targets and their count per frame."""
+    targets = [t for frame in frames for t in (getattr(frame, "ak", None) or [])]
+    if not frames:
+        return None
+    if not targets:
+        return np.array([np.nan, np.nan, np.nan, 0.0])
+    values = np.array([(t.rng, t.vel, t.ang) for t in targets], dtype=float)
+    return np.append(values.mean(axis=0), len(targets) / len(frames))
+
+
+def abs_distance(a, b) -> float:
+    diff = np.abs(a - b)
+    return float(np.nanmax(diff)) if not np.isnan(diff).all() else np.inf
+
+
+def nan_mean(values) -> np.ndarray:
+    stacked = np.stack(values)
+    return np.full(stacked.shape[1:], np.nan) if np.isnan(stacked).all() else np.nanmean(stacked, axis=0)
+
+
+ANT_CALIB_METRIC = Metric(ant_calib_value, phase_distance, phase_mean)
+AKBK_METRIC = Metric(akbk_value, abs_distance, nan_mean)
+
+
+def _coarse_indices(count, step):
+    indices = list(range(0, count, step))
+    if indices[-1] != count - 1:
+        indices.append(count - 1)
+    return indices
+
+
+def _mid(lo, hi):
+    return (lo + hi) // 2 if hi - lo > 1 else None
+
+
+class AdaptiveSampler:
+    def __init__(self, spec: str, coarse: int = 8, error_target: float = 5.0, budget: int = None,
+                 metric: Metric = None, start: dict = None):
+        grid = parse_grid(spec)
+        if grid is None:
+            raise ValueError("Adaptive sampling needs a grid like 'H@-60:60:2*V@-50:50:2', not {!r}".format(spec))
+        self.spec = spec
+        self.axes = [grid.get("x"), grid.get("y")]
+        self.coarse = coarse
+        self.error_target = error_target
+        self.budget = budget
+        self.metric = metric
+        self.start = start or dict(x=0, y=0)
+        self.values = {}
+        self.errors = {}
+        self._sources = {}
+        self._cells = []
+        self._last = None
+
+    @property
+    def full_size(self):
+        return int(np.prod([len(axis) for axis in self.axes if axis is not None]))
+
+    def _pos(self, index) -> dict:
+        return {key: axis[i] if axis is not None else 0
+                for key, axis, i in zip(("x", "y"), self.axes, index)}
+
+    def _index(self, pos) -> tuple:
+        return tuple(axis.index(pos[key]) if axis is not None else 0 for key, axis in zip(("x", "y"), self.axes))
+
+    def add(self, pos: dict, data, metric: Metric = None):
+        metric = self.metric or metric or ANT_CALIB_METRIC
+        index = self._index(pos)
+        value = self.values[index] = metric.value(data)
+        self._last = metric
+
+        sources = [self.values.get(source) for source in self._sources.pop(index, ())]
+        if value is not None and sources and all(source is not None for source in sources):
+            self.errors[index] = metric.distance(value, metric.mean(sources))
+
+    def _variation(self, cell) -> float:
+        x0, x1, y0, y1 = cell
+        indices = {(x0, y0), (x1, y0), (x0, y1), (x1, y1)}
+        errors = [self.errors[index] for index in indices if index in self.errors]
+        if errors:
+            return max(errors)
+        corners = [self.values.get(index) for index in indices]
+        if any(value is None for value in corners) or self._last is None:
+            return 0.0
+        return max((self._last.distance(a, b) for i, a in enumerate(corners) for b in corners[i + 1:]), default=0.0)
+
+    def _push(self, cell):
+        x0, x1, y0, y1 = cell
+        if _mid(x0, x1) is None and _mid(y0, y1) is None:
+            return
+        variation = self._variation(cell)
+        if variation > self.error_target:
+            heapq.heappush(self._cells, (-variation, cell))
+
+    def _split(self, cell):
+        x0, x1, y0, y1 = cell
+        xs = [x0, x1] if _mid(x0, x1) is None else [x0, _mid(x0, x1), x1]
+        ys = [y0, y1] if _mid(y0, y1) is None else [y0, _mid(y0, y1), y1]
+        points = [(x, y) for x in xs for y in ys]
+        for x in xs:
+            for y in ys:
+                # midpoints are interpolated from corners of the cell they split.
+                sources = [(cx, cy) for cx in ((x,) if x in (x0, x1) else (x0, x1))
+                           for cy in ((y,) if y in (y0, y1) else (y0, y1))]
+                if (x, y) not in self.values and len(sources) > 1:
+                    self._sources.setdefault((x, y), sources)
+        children = [(xa, xb, ya, yb) for xa, xb in zip(xs, xs[1:]) for ya, yb in zip(ys, ys[1:])]
+        return points, children
+
+    def _coarse(self):
+        xs, ys = [_coarse_indices(len(axis), self.coarse) if axis is not None else [0] for axis in self.axes]
+        points = [(x, y) for x in xs for y in ys]
+        cells = [(xa, xb, ya, yb) for xa, xb in zip(xs, xs[1:] or xs) for ya, yb in zip(ys, ys[1:] or ys)]
+        return points, cells
+
+    def _take(self, points, left):
+        points = [point for point in dict.fromkeys(points) if point not in self.values]
+        return points[:left] if left is not None else points
+
+    def __iter__(self) -> Iterator[dict]:
+        points, pending = self._coarse()
+        last = self.start
+        level = 0
+        while points:
+            left = self.budget - len(self.values) if self.budget is not None else None
+            batch = [self._pos(index) for index in self._take(points, left)]
+            logger.debug("adaptive level %d: %d positions.", level, len(batch))
+            for pos in order_nearest(batch, last):
+                yield pos
+                last = pos
+
+            for cell in pending:
+                self._push(cell)
+            if self.budget is not None and len(self.values) >= self.budget:
+                break
+
+            # split every cell out of target in this level, most varying first when budget is short.
+            points, pending = [], []
+            while self._cells:
+                _, cell = heapq.heappop(self._cells)
+                new_points, children = self._split(cell)
+                points.extend(new_points)
+                pending.extend(children)
+            level += 1
+
+        logger.info("adaptive sampling of %s: %d of %d positions, %d cells still out of target %.3f.",
+                    self.spec, len(self.values), self.full_size, len(self._cells), self.error_target)
+
+    def sampled(self) -> list:
+        return [self._pos(index) for index in sorted(self.values, key=lambda index: (index[1], index[0]))]
@@ -2,59 +2,100 @@
 
 import re
 import time
-from typing import List
-from pprint import pprint
+from collections import OrderedDict
+from typing import Dict, List
 from ngta import TestCase, TestEventHandler, current_context
 from coupling.dict import AttrDict
 from bench import MeasureTestBench
 from calterah.constants import LOCH_HTTP_URL
+from uploader import HistoryUploader, DEFAULT_SPOOL_DIR
+from concurrency import fan_out_each
+from stats import StreamingStats, stream_stats, to_summary
+import timing
 
 import numpy as np
-import requests
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 class BaseTestCase(TestCase):
-    pass
+    def stream_stats(self, name: str = "data", **options) -> StreamingStats:
+        """Streaming statistics kept in record.extras[name], see stats.stream_stats."""
+        return stream_stats(self.record.extras, name, **options)
 
 
 class AnalyzerTestCase(BaseTestCase):
     testbench: MeasureTestBench
 
     def setup(self):
+        self._setup_analyzer()
+        # settings skipped as cached may have been changed on the instrument, verify resyncs it with a preset.
+        if self.parameters.get("verify_analyzer") and not self.testbench.analyzer.verify():
+            self._setup_analyzer()
+
+        self.testbench.dut.command_batch(['bb_interframe single', 'scan start 1'])
+        self.record.extras["chip_name"] = self.testbench.dut.chip_name
+
+    def _setup_analyzer(self):
         self.testbench.analyzer.preset()
         self.testbench.analyzer.mixer_signal_id()
         self.testbench.analyzer.trace('MAXHold')
         self.testbench.analyzer.peak_table(threshold=self.parameters.threshold)
         self.testbench.analyzer.command(':SENS:BAND:RES 100000')   # RBW: sense bandwidth resolution:
 
-        min_freq = min(self.parameters.frequencies) - 1
-        max_freq = max(self.parameters.frequencies) + 1
-        self.testbench.analyzer.frequency('{} GHz'.format(min_freq), '{} GHz'.format(max_freq))
+        # in zoom mode analyzer is tuned around every hold frequency by _measure_peak.
+        if not self.parameters.get("zoom_span"):
+            min_freq = min(self.parameters.frequencies) - 1
+            max_freq = max(self.parameters.frequencies) + 1
+            self.testbench.analyzer.frequency('{} GHz'.format(min_freq), '{} GHz'.format(max_freq))
 
-        self.testbench.dut.command('bb_interframe single')
-        self.testbench.dut.command('scan start 1')
-        self.record.extras["chip_name"] = self.testbench.dut.chip_name
+    def _named_devices(self, dev=None) -> Dict[str, object]:
+        """dev is one device, a list of them (e.g. [dut, src]) or None for dut."""
+        devs = dev if isinstance(dev, (list, tuple)) else [dev or self.testbench.dut]
+        named = OrderedDict()
+        for i, d in enumerate(devs):
+            name = next((n for n in ("dut", "src") if getattr(self.testbench, n, None) is d), "dev{}".format(i))
+            named[name] = d
+        return named
 
     def _enable_tx(self, tx, dev=None):
-        index = tx["index"]
-        phase = tx["phase"]
-        dev = dev or self.testbench.dut
-        dev.command('radio_tx on %s' % index)
-        if phase:
-            dev.command('radio_txphase {} {}'.format(index, phase))
+        self._enable_all_tx([tx], dev)
 
-    def _check_all_tx_phase(self, tx_config: List[dict], dev=None):
-        dev = dev or self.testbench.dut
-        s = dev.command('radio_txphase')
-        founds = re.findall(r'CH(\d):(\d{1,3})', s)
-        actual_phases = dict(founds)
+    def _enable_all_tx(self, tx_config: List[dict], dev=None, read_back=False) -> Dict[str, str]:
+        """
+        Enable TX channels and set their phases with one command batch per device, several devices are
+        configured concurrently. Return phases read back at the end of the batch by device name.
+        """
+        def configure(d):
+            with d.batch() as batch:
+                for tx in tx_config:
+                    batch.add('radio_tx on %s' % tx["index"])
+                    if tx["phase"]:
+                        batch.add('radio_txphase {} {}'.format(tx["index"], tx["phase"]))
+                if read_back:
+                    batch.add('radio_txphase')
+            return batch.responses[-1] if read_back else None
+        return fan_out_each(self._named_devices(dev), configure, title="enable tx")
+
+    def _configure_all_tx(self, tx_config: List[dict], dev=None):
+        """Enable all TX channels and check their phases with a single batch per device."""
+        resp = self._enable_all_tx(tx_config, dev, read_back=True)
+        self._check_all_tx_phase(tx_config, dev, resp)
+
+    def _check_all_tx_phase(self, tx_config: List[dict], dev=None, resp: Dict[str, str] = None):
+        if resp is None:
+            resp = fan_out_each(self._named_devices(dev), lambda d: d.command('radio_txphase'), title="read tx phase")
         with self.soft_assertions():
-            for tx in tx_config:
-                index = tx["index"]
-                phase = tx["phase"]
-                if phase:
-                    actual_phase = int(actual_phases[str(index)])
-                    self.assert_that(phase).is_equal_to(actual_phase)
+            for s in resp.values():
+                founds = re.findall(r'CH(\d):(\d{1,3})', s)
+                actual_phases = dict(founds)
+                for tx in tx_config:
+                    index = tx["index"]
+                    phase = tx["phase"]
+                    if phase:
+                        actual_phase = int(actual_phases[str(index)])
+                        self.assert_that(phase).is_equal_to(actual_phase)
 
     def _check_one_tx_phase(self, tx):
         s = self.testbench.dut.command('radio_txphase')
@@ -65,8 +106,41 @@ class AnalyzerTestCase(BaseTestCase):
         if phase:
             self.assert_that(phase).is_equal_to(actual_phases[index])
 
-    def _measure_peak(self, freq, wait=3, unlocked_retry: int = 3, unlocked_interval=1):
+    def _zoom(self, center, span, rbw):
+        """
+        Tune analyzer to span (Hz) around center (GHz) with rbw (Hz). Sweep time grows with span / rbw^2, a
+        narrow span sweeps orders faster than the wide one of setup. Unchanged settings aren't sent again.
+        """
+        self.testbench.analyzer.command(':SENS:BAND:RES {}'.format(int(rbw)))
+        self.testbench.analyzer.frequency('{} GHz'.format(round(center - span / 2e9, 6)),
+                                          '{} GHz'.format(round(center + span / 2e9, 6)))
+
+    def _measure_peaks(self, frequencies, **kwargs) -> List[AttrDict]:
+        """Measure a whole frequency list after one setup, see _measure_peak for options, e.g. zoom_span."""
+        return [self._measure_peak(freq, **kwargs) for freq in frequencies]
+
+    def _measure_peak(self, freq, wait=3, unlocked_retry: int = 3, unlocked_interval=1,
+                      adaptive=False, poll_interval=0.2, freq_tolerance=1e5, dbm_tolerance=0.5, stable_count=2,
+                      zoom_span=None, zoom_rbw=1e5, coarse_rbw=None, zoom_sweeps=3):
+        """
+        With zoom_span (Hz), analyzer is tuned to that span around freq before measuring. zoom_span defaults to
+        the testcase parameter, which also makes setup skip the wide span. Without adaptive, the zoomed peak is
+        waited for zoom_sweeps sweeps of the time analyzer reports, at most wait.
+        With coarse_rbw and adaptive, the peak is first searched with it, then measured again with zoom_rbw in
+        a 10 times narrower span around it. Without adaptive, coarse_rbw is ignored and the peak is measured
+        once with zoom_rbw.
+        """
         record = AttrDict()
+        if zoom_span is None:
+            zoom_span = self.parameters.get("zoom_span")
+        coarse = bool(zoom_span and coarse_rbw and adaptive)
+        if zoom_span:
+            self._zoom(freq, zoom_span, coarse_rbw if coarse else zoom_rbw)
+            # wait is sized for the wide span of setup, a zoomed sweep is orders shorter.
+            sweep_time = None if adaptive else self._sweep_time()
+            if sweep_time:
+                wait = min(wait, zoom_sweeps * sweep_time)
+
         if self.testbench.dut.chip_rev == 'MP':
             cmd = 'radio_single_tone {}'
         else:
@@ -79,24 +153,71 @@ class AnalyzerTestCase(BaseTestCase):
 
             record.is_unlocked = 'unlocked' in resp
             if record.is_unlocked:
-                time.sleep(unlocked_interval)
+                timing.sleep(unlocked_interval)
             else:
                 break
 
-        time.sleep(wait)        # get peak list from analyzer after waiting.
+        # get peak list from analyzer after waiting, in adaptive mode wait is the upper bound.
+        record.settle_time = self._wait_peak(wait, adaptive, poll_interval, freq_tolerance, dbm_tolerance,
+                                             stable_count)
         record.hold = freq
         record.peak, record.dbm = self._fetch_peak()
+
+        if coarse and record.peak is not None:
+            self._zoom(record.peak / 1e9, zoom_span / 10, zoom_rbw)
+            self.testbench.analyzer.trace('write')
+            self.testbench.analyzer.trace('MAXHold')
+            record.settle_time += self._wait_peak(wait, adaptive, poll_interval, freq_tolerance, dbm_tolerance,
+                                                  stable_count)
+            record.peak, record.dbm = self._fetch_peak()
         return record
 
+    def _sweep_time(self):
+        """Sweep time (s) of current analyzer settings, None if analyzer doesn't answer it."""
+        try:
+            return float(self.testbench.analyzer.command(':SENS:SWE:TIME?'))
+        except (TypeError, ValueError):
+            return None
+
+    def _wait_peak(self, wait, adaptive, poll_interval, freq_tolerance, dbm_tolerance, stable_count):
+        if adaptive:
+            return self._wait_peak_settled(wait, poll_interval, freq_tolerance, dbm_tolerance, stable_count)
+        timing.sleep(wait)
+        return wait
+
+    def _wait_peak_settled(self, wait, poll_interval, freq_tolerance, dbm_tolerance, stable_count=2):
+        """Poll max-hold peak until it changes less than tolerances for stable_count polls, return time used."""
+        start = time.monotonic()
+        last_peak, last_dbm = None, None
+        stable = 0
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= wait:
+                return wait
+            timing.sleep(min(poll_interval, wait - elapsed))
+
+            peak, dbm = self._select_peak(self.testbench.analyzer.get_peak_list(), warn=False)
+            if peak is not None and last_peak is not None \
+                    and abs(peak - last_peak) <= freq_tolerance and abs(dbm - last_dbm) <= dbm_tolerance:
+                stable += 1
+                if stable >= stable_count:
+                    return time.monotonic() - start
+            else:
+                stable = 0
+            last_peak, last_dbm = peak, dbm
+
     def _fetch_peak(self):
-        raw_peak_list = self.testbench.analyzer.get_peak_list()
+        return self._select_peak(self.testbench.analyzer.get_peak_list())
+
+    def _select_peak(self, raw_peak_list, warn=True):
         if len(raw_peak_list) == 1:
             peak, dbm = raw_peak_list[0]
         elif len(raw_peak_list) == 0:
             peak = None
             dbm = None
         else:
-            self.warn_('peak list should not greater than 1.')
+            if warn:
+                self.warn_('peak list should not greater than 1.')
             dbm_list = list(np.array(raw_peak_list)[:, 1])
             index = dbm_list.index(max(dbm_list))
             peak, dbm = raw_peak_list[index]
@@ -104,7 +225,8 @@ class AnalyzerTestCase(BaseTestCase):
 
 
 class TestRecordHandler(TestEventHandler):
-    def __init__(self, board_name, board_rev, sn, comment, tester, test_type):
+    def __init__(self, board_name, board_rev, sn, comment, tester, test_type,
+                 async_upload=True, spool_dir=DEFAULT_SPOOL_DIR, batch_size=1, close_timeout=30):
         super().__init__()
         self.board_name = board_name
         self.board_rev = board_rev
@@ -112,6 +234,10 @@ class TestRecordHandler(TestEventHandler):
         self.comment = comment
         self.tester = tester
         self.test_type = test_type
+        self.uploader = HistoryUploader(LOCH_HTTP_URL, spool_dir=spool_dir, batch_size=batch_size)
+        self.close_timeout = close_timeout
+        if async_upload:
+            self.uploader.start()
 
     def on_testcase_stopped(self, event) -> None:
         testcase = event.target
@@ -126,18 +252,16 @@ class TestRecordHandler(TestEventHandler):
                 'sn': self.sn,
                 'comment': self.comment,
                 'tester': self.tester,
-                'data': record.extras['data'],
+                'data': to_summary(record.extras['data']),
                 # 'command': " ".join(sys.argv)
             }
 
-            pprint(data)
-            resp = requests.post('{}/loch/api/histories/{}'.format(LOCH_HTTP_URL, self.test_type), json=data)
-            if resp.ok:
-                print('*** Access {}/history/{}/{} to view result'.format(
-                    self.test_type, LOCH_HTTP_URL, resp.json()['id'])
-                )
-            else:
-                raise Exception('Upload data to server failed.')
+            logger.info("Upload %s result of %s %s, data keys: %s", self.test_type, self.board_name, self.sn,
+                        ", ".join(data['data']) if isinstance(data['data'], dict) else type(data['data']).__name__)
+            self.uploader.submit(self.test_type, data)
+
+    def on_testrunner_stopped(self, event) -> None:
+        self.uploader.close(self.close_timeout)
 
 
 def get_index_and_phase_from_tx(tx):
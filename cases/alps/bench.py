@@ -2,15 +2,27 @@
 
 import os
 import atexit
-from typing import List, Optional
+from collections import OrderedDict
+from typing import List, Optional, Dict, Union, TYPE_CHECKING
 from ngta import TestBench as BaseTestBench, TestCase
 from ngta.agent import TestBench as AgentTestBench
-from calterah.simulator.keycom import find_simulators, get_default_setups_by_freq, DEFAULT_RTS_LIB_DIR, Simulators
-from pywinauto import Application
 
 from calterah.adapters import alps
 from calterah import arduino
-from calterah.instruments.analyzer import AnalyzerFactory
+from instruments import CachedAnalyzer
+from device import CachedDeviceAdapter
+from concurrency import fan_out
+from scheduling import order_by_bench_mode, get_bench_mode, GUI_MODE
+from targets import TargetPool
+from session import SessionRecorder
+from sharding import register_bench, group_of
+import stats
+import timing
+from timing import instrument_bench
+
+# heavy optional dependencies (pywinauto, keycom simulators, analyzer) are imported when first used.
+if TYPE_CHECKING:
+    from calterah.simulator.keycom import Simulators
 
 import logging
 logger = logging.getLogger(__name__)
@@ -21,21 +33,22 @@ class MeasureTestBench(BaseTestBench):
                  dut_comport=None, dut_baudrate=None,
                  dut_fw_override=False, dut_fw_src_dir=None, dut_fw_make_options=None,
                  rot_comport=None, analyzer_host=None,
-                 src_comport=None, src_baudrate=None
+                 src_comport=None, src_baudrate=None,
+                 collect_timing=False, trace_path=None, record_path=None
                  ):
         super().__init__("MeasureTestBench", type='alps', exclusive=True)
 
         if not dut_comport:
             dut_comport = alps.find_available_comport()
         dut_baudrate = dut_baudrate or 3000000
-        self.dut = alps.DeviceAdapter(
+        self.dut = CachedDeviceAdapter(alps.DeviceAdapter(
             comport=dut_comport, baudrate=dut_baudrate,
             fw_override=dut_fw_override, fw_src_dir=dut_fw_src_dir, fw_make_options=dut_fw_make_options
-        )
+        ))
 
         if src_comport:
             src_baudrate = src_baudrate or 3000000
-            self.src = alps.DeviceAdapter(comport=src_comport, baudrate=src_baudrate)
+            self.src = CachedDeviceAdapter(alps.DeviceAdapter(comport=src_comport, baudrate=src_baudrate))
         else:
             self.src = None
 
@@ -44,52 +57,100 @@ class MeasureTestBench(BaseTestBench):
         self.rot = arduino.Rotary(rot_comport) if rot_comport else None
 
         if analyzer_host:
+            from calterah.instruments.analyzer import AnalyzerFactory
+
             if "::" in analyzer_host:
                 ana_kwargs = {"resource": analyzer_host}
             else:
                 ana_kwargs = {"host": analyzer_host}
-            self.analyzer = AnalyzerFactory.new_analyzer(**ana_kwargs)
+            self.analyzer = CachedAnalyzer(AnalyzerFactory.new_analyzer(**ana_kwargs))
         else:
             self.analyzer = None
+
+        self.recorder = SessionRecorder(record_path, bench=self.name) if record_path else None
+        if self.recorder:
+            self.recorder.attach(self)
+
+        self.trace_path = trace_path
+        if collect_timing or trace_path:
+            timing.enable(keep_events=bool(trace_path))
+            instrument_bench(self)
         atexit.register(self.on_testrunner_stopped, None)
 
     def on_testrunner_started(self, event):
-        self.dut.open()
+        # dut, src, rotary and analyzer sit on independent links, open them in parallel.
+        calls = OrderedDict(dut=self.dut.open)
         if self.src:
-            self.src.open()
-
+            calls["src"] = self.src.open
         if self.rot and not self.rot.is_open():
-            self.rot.open()
-            self.rot.reset()
-
+            calls["rotary"] = self._bring_up_rotary
         if self.analyzer:
-            self.analyzer.open()
+            calls["analyzer"] = self.analyzer.open
+        fan_out(calls, title="open {}".format(self.name))
+
+    def _bring_up_rotary(self):
+        self.rot.open()
+        self.rot.reset()
+
+    def _shut_down_rotary(self):
+        self.rot.reset()
+        self.rot.close()
 
     def on_testrunner_stopped(self, event):
+        calls = OrderedDict()
         if self.analyzer:
-            self.analyzer.close()
-
+            calls["analyzer"] = self.analyzer.close
         if self.rot and self.rot.is_open():
-            self.rot.reset()
-            self.rot.close()
-
+            calls["rotary"] = self._shut_down_rotary
         if self.src:
-            self.src.close()
+            calls["src"] = self.src.close
+        calls["dut"] = self.dut.close
+        try:
+            fan_out(calls, title="close {}".format(self.name))
+        finally:
+            if self.recorder:
+                self.recorder.close()
+            if self.trace_path:
+                timing.export_chrome_trace(self.trace_path)
+            timing.log_background()
 
-        self.dut.close()
+    def on_testcase_started(self, event):
+        timing.on_testcase_started(event)
+
+    def on_testcase_stopped(self, event):
+        timing.on_testcase_stopped(event)
+        stats.on_testcase_stopped(event)
 
 
 ALPS_GUI_EXE_PATH = r"C:\Calterah\DevHelper_alps.exe"
 
 
-class AppWrapper(Application):
+class AppWrapper:
     def __init__(self, exe_path: str, *args, **kwargs):
-        super().__init__(*args, **kwargs)
         self.exe_path = exe_path
         self.is_closed = True
         self.main_page = None
         self.uart_page = None
         self.track_fps = None
+        self._app_args = args
+        self._app_kwargs = kwargs
+        self._app = None
+
+    def __getattr__(self, name):
+        # only called for missing attributes, e.g. before __init__ ran when copied or unpickled.
+        if name.startswith("_") or "_app_args" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.application, name)
+
+    @property
+    def application(self):
+        if self.__dict__.get("_app") is None:
+            from pywinauto import Application
+            self._app = Application(*self._app_args, **self._app_kwargs)
+        return self._app
+
+    def is_process_running(self):
+        return self._app is not None and self._app.is_process_running()
 
     def restart(self):
         self.close()
@@ -116,7 +177,7 @@ class AppWrapper(Application):
 
 
 class TestBench(AgentTestBench):
-    simulators: Simulators
+    simulators: 'Simulators'
     dut: Optional[alps.DeviceAdapter]
     rot: Optional[arduino.Rotary]
     app: Optional[AppWrapper]
@@ -124,28 +185,71 @@ class TestBench(AgentTestBench):
     def __init__(self,
                  name: str,
                  alps_gui_exe_path: str = ALPS_GUI_EXE_PATH,
-                 rts_lib_dir: str = DEFAULT_RTS_LIB_DIR,
+                 rts_lib_dir: str = None,
                  rts_setups: List[dict] = None,
                  routes: List[str] = None,
-                 group: str = None):
+                 group: str = None,
+                 bringup_timeout: Union[float, Dict[str, float]] = None,
+                 reorder_by_mode: bool = False,
+                 mode_depends: Dict[str, List[str]] = None,
+                 collect_timing: bool = False,
+                 trace_path: str = None,
+                 record_path: str = None):
         super().__init__(name=name, type='alps', exclusive=True, routes=routes, group=group)
-        self.simulators = Simulators()
+        register_bench(self, group)
+        self.is_started = False
+        self._simulators = None
         self.alps_gui_exe_name = os.path.basename(alps_gui_exe_path)
         self.alps_gui_exe_path = alps_gui_exe_path
         self.rts_setups = rts_setups
         self.rts_lib_dir = rts_lib_dir
+        self.bringup_timeout = bringup_timeout or {}
+        self.reorder_by_mode = reorder_by_mode
+        self.mode_depends = mode_depends or {}
+        self.mode = None
+        self.mode_switches = 0
+        self._target_pool = None
+        self.collect_timing = collect_timing
+        self.trace_path = trace_path
+        self.record_path = record_path
+        self.recorder = None
 
         # for support running testcase in agent, assign following vars in method on_testrunner_started.
         self.dut = None
         self.app = None
         self.rot = None
+        self.sensor_cfg = {}
 
     def __str__(self):
         return "<{}(name:{})>".format(self.__class__.__name__, self.name)
 
-    def on_testrunner_started(self, event):
-        self.simulators = find_simulators(self.rts_lib_dir)
-        self.dut = alps.DeviceAdapter(alps.find_available_comport(), fw_override=False)
+    @property
+    def simulators(self) -> 'Simulators':
+        if self._simulators is None:
+            from calterah.simulator.keycom import Simulators
+            self._simulators = Simulators()
+        return self._simulators
+
+    @simulators.setter
+    def simulators(self, value: 'Simulators'):
+        self._simulators = value
+
+    @property
+    def target_pool(self) -> TargetPool:
+        if self._target_pool is None:
+            self._target_pool = TargetPool(self.simulators)
+        return self._target_pool
+
+    def release_targets(self):
+        if self._target_pool is not None:
+            self._target_pool.close()
+            self._target_pool = None
+
+    def _create_devices(self):
+        from calterah.simulator.keycom import find_simulators, get_default_setups_by_freq, DEFAULT_RTS_LIB_DIR
+
+        self.simulators = find_simulators(self.rts_lib_dir or DEFAULT_RTS_LIB_DIR)
+        self.dut = CachedDeviceAdapter(alps.DeviceAdapter(alps.find_available_comport(), fw_override=False))
         self.app = AppWrapper(self.alps_gui_exe_path, backend="uia")
 
         comport = arduino.find_available_comport()
@@ -154,45 +258,114 @@ class TestBench(AgentTestBench):
 
         os.system('taskkill /F /T /IM {}'.format(self.alps_gui_exe_name))
 
+    def on_testrunner_started(self, event):
+        self._create_devices()
+        self.is_started = True
+        if self.record_path:
+            self.recorder = SessionRecorder(self.record_path, bench=self.name, rts_setups=self.rts_setups)
+            self.recorder.attach(self)
+        if self.collect_timing or self.trace_path:
+            timing.enable(keep_events=bool(self.trace_path))
+            instrument_bench(self)
+
+        # instruments are independent, bring them up in parallel, runner start is bounded by the slowest one.
+        calls = {"dut": self._bring_up_dut}
+        for index, simulator in enumerate(self.simulators):
+            calls["simulator{}".format(index)] = lambda index=index, simulator=simulator: \
+                self._bring_up_simulator(index, simulator)
+        if self.rot:
+            calls["rotary"] = self._bring_up_rotary
+        fan_out(calls, timeout=self.bringup_timeout, title="bring up {}".format(self.name))
+
+        # if not self.rts_setups:
+        #     self.rts_setups = get_default_setups_by_freq(center_freq)
+
+        self.app.track_fps = self.sensor_cfg["track_fps"]
+
+    def _bring_up_dut(self):
+        # sensor cfg comes from one bulk dump, following reads are served from cache.
         self.dut.try_open()
         fmcw_startfreq = self.dut.get_sensor_cfg("fmcw_startfreq")
         fmcw_bandwidth = self.dut.get_sensor_cfg("fmcw_bandwidth")
         center_freq = fmcw_startfreq + fmcw_bandwidth * 1e-3 / 2
         track_fps = self.dut.get_sensor_cfg("track_fps")
+        self.sensor_cfg = dict(fmcw_startfreq=fmcw_startfreq, fmcw_bandwidth=fmcw_bandwidth, track_fps=track_fps)
+        return center_freq
 
-        # if not self.rts_setups:
-        #     self.rts_setups = get_default_setups_by_freq(center_freq)
-
-        for index, simulator in enumerate(self.simulators):
-            simulator.open()
-            try:
-                simulator.setup(**self.rts_setups[index])
-            except IndexError:
-                logger.warning("Don't find rts setup for %s", simulator)
+    def _bring_up_simulator(self, index, simulator):
+        simulator.open()
+        try:
+            simulator.setup(**self.rts_setups[index])
+        except IndexError:
+            logger.warning("Don't find rts setup for %s", simulator)
 
-        self.app.track_fps = track_fps
-
-        if self.rot:
-            self.rot.open()
-            self.rot.reset()
+    def _bring_up_rotary(self):
+        self.rot.open()
+        self.rot.reset()
 
     def on_testrunner_stopped(self, event):
+        self.is_started = False
         if self.rot:
             self.rot.reset()
             self.rot.close()
 
+        self.release_targets()
         for simulator in self.simulators:
             simulator.close()
 
+        logger.info("%s switched bench mode %d times.", self, self.mode_switches)
+        logger.info("%s dut cache: %s", self, self.dut.stats())
+
         if self.app.is_process_running():
             self.app.close()
 
         if self.dut.is_open:
             self.dut.close()
 
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+        if self.trace_path:
+            timing.export_chrome_trace(self.trace_path)
+        timing.log_background()
+
+    def on_testsuite_started(self, event):
+        if not self.reorder_by_mode:
+            return
+
+        # only reorder consecutive testcases, nested testsuites stay where they are.
+        tests = event.target.tests
+        ordered = []
+        segment = []
+        removed = 0
+        for test in list(tests) + [None]:
+            if isinstance(test, TestCase):
+                segment.append(test)
+                continue
+            if segment:
+                segment, before, after = order_by_bench_mode(segment, self.mode_depends)
+                ordered.extend(segment)
+                removed += before - after
+                segment = []
+            if test is not None:
+                ordered.append(test)
+        tests[:] = ordered
+        logger.info("Reorder %s by bench mode, %d mode switches removed.", event.target, removed)
+
+    def on_testsuite_stopped(self, event):
+        self.release_targets()
+
     def on_testcase_started(self, event):
+        timing.on_testcase_started(event)
         testcase: TestCase = event.target
-        if testcase.path.startswith("alps.gui"):
+        mode = get_bench_mode(testcase)
+        if self.mode is not None and mode != self.mode:
+            self.mode_switches += 1
+        self.mode = mode
+
+        # resources are kept open when next testcase requires same mode.
+        if mode == GUI_MODE:
             if self.dut.is_open:
                 self.dut.close()
 
@@ -205,13 +378,28 @@ class TestBench(AgentTestBench):
             if not self.dut.is_open:
                 self.dut.open()
 
+    def on_testcase_stopped(self, event):
+        timing.on_testcase_stopped(event)
+        stats.on_testcase_stopped(event)
+
     def as_dict(self):
         d = super().as_dict()
         d['rts_setups'] = self.rts_setups
         d['rts_lib_dir'] = self.rts_lib_dir
         d['routes'] = self.routes
+        d['group'] = group_of(self)
+        d['bringup_timeout'] = self.bringup_timeout
+        d['reorder_by_mode'] = self.reorder_by_mode
+        d['mode_depends'] = self.mode_depends
+        d['collect_timing'] = self.collect_timing
+        d['trace_path'] = self.trace_path
+        d['record_path'] = self.record_path
         return d
 
     @classmethod
     def from_dict(cls, d) -> 'TestBench':
-        return cls(d["name"], rts_lib_dir=d["rts_lib_dir"],  rts_setups=d["rts_setups"], routes=d["routes"])
+        return cls(d["name"], rts_lib_dir=d["rts_lib_dir"],  rts_setups=d["rts_setups"], routes=d["routes"],
+                   group=d.get("group"), bringup_timeout=d.get("bringup_timeout"), reorder_by_mode=d.get("reorder_by_mode", False),
+                   mode_depends=d.get("mode_depends"),
+                   collect_timing=d.get("collect_timing", d.get("timing", False)), trace_path=d.get("trace_path"),
+                   record_path=d.get("record_path"))
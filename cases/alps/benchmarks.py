@@ -0,0 +1,611 @@
+# coding: utf-8
+
+# command: cd c:\src\kite\cases\alps && python benchmarks.py ant_calib --input=C:\src\collect_ant_calib_for_angles.txt
+# command: cd c:\src\kite\cases\alps && python benchmarks.py suite [--save-baseline]
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import tempfile
+import timeit
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from parsers import parse_ant_calib, parse_ant_calib_file, check_ant_calib, check_range_and_index
+
+
+def _legacy_check_range_and_index(text, rng_index):
+    lines = text.strip().split('\n')
+    for line in lines[1:]:
+        match = re.search(r'rng_index (\d+)', line)
+        new_rng_index = match.group(1)
+        if rng_index is None:
+            rng_index = new_rng_index
+        elif rng_index != new_rng_index:
+            raise AssertionError("rng_index is not match")
+        if re.search(r'range 0.00', line):
+            raise AssertionError("range should not be 0.00")
+    return rng_index
+
+
+def load_ant_calib_responses(path):
+    """Split a file written by collect_ant_calib_for_angles back into responses."""
+    responses = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith("ant_calib") or not responses:
+                responses.append(line)
+            else:
+                responses[-1] += line
+    return responses
+
+
+def make_ant_calib_responses(npos=500, nline=4, nchannel=8, seed=0):
+    rand = random.Random(seed)
+    responses = []
+    for i in range(npos):
+        lines = ["ant_calib X{}Y0".format(i)]
+        for _ in range(nline):
+            values = " ".join("{:.4f}".format(rand.uniform(-180, 180)) for _ in range(nchannel))
+            lines.append("rng_index 12 range {:.2f} {}".format(rand.uniform(3, 4), values))
+        responses.append("\n".join(lines) + "\n")
+    return responses
+
+
+def _legacy_extract(text):
+    records = []
+    for line in text.strip().split('\n')[1:]:
+        rng_index = int(re.search(r'rng_index (\d+)', line).group(1))
+        rest = line[re.search(r'range ', line).end():]
+        values = [float(v) for v in re.findall(r'(-?\d+\.\d+)', rest)]
+        records.append((rng_index, values[0], values[1:]))
+    return records
+
+
+def _best(func, number):
+    return min(timeit.repeat(func, number=1, repeat=number))
+
+
+def bench_ant_calib(responses, number=5, path=None):
+    """
+    Compare the legacy path with the current one per response while collecting: check alone (default), and
+    check with values extracted (as_array). The file parser is timed over the whole recorded file.
+    """
+    def legacy_check():
+        rng_index = None
+        for resp in responses:
+            rng_index = _legacy_check_range_and_index(resp, rng_index)
+
+    def legacy_check_and_extract():
+        legacy_check()
+        for resp in responses:
+            _legacy_extract(resp)
+
+    def check():
+        rng_index = None
+        for resp in responses:
+            rng_index = check_ant_calib(resp, rng_index)
+
+    def check_and_parse():
+        rng_index = None
+        for resp in responses:
+            rng_index = check_range_and_index(parse_ant_calib(resp), rng_index)
+
+    def parse_file():
+        check_range_and_index(parse_ant_calib_file(path))
+
+    result = dict(
+        legacy_check=_best(legacy_check, number),
+        check=_best(check, number),
+        legacy_check_and_extract=_best(legacy_check_and_extract, number),
+        check_and_parse=_best(check_and_parse, number),
+    )
+    if path:
+        result["parse_file"] = _best(parse_file, number)
+
+    for name, elapsed in result.items():
+        print("{:26s} {:10.2f} us/response".format(name, elapsed / len(responses) * 1e6))
+    print("check speedup             {:10.2f}x".format(result["legacy_check"] / result["check"]))
+    print("check and parse speedup   {:10.2f}x".format(result["legacy_check_and_extract"] / result["check_and_parse"]))
+    if path:
+        print("file speedup              {:10.2f}x".format(result["legacy_check_and_extract"] / result["parse_file"]))
+    return result
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks_baseline.json")
+
+OPTIONAL_PACKAGES = ("ngta", "calterah", "coupling", "pywinauto")
+
+# speedups of a hot path over its plain version measured in the same run, they hold on any machine unlike
+# absolute figures, which are only printed. metric -> higher is better
+SUITE_METRICS = {
+    "collect.akbk.pipelined_speedup": True,
+    "check.ant_calib.speedup": True,
+    "parse.ant_calib.speedup": True,
+    "check.batch_speedup": True,
+    "peak.adaptive_speedup": True,
+    "peak.zoom_speedup": True,
+    "peak.zoom_fixed_speedup": True,
+    "dut.tx_config.batch_speedup": True,
+    "shard.group_speedup": True,
+    "shard.process_speedup": True,
+    "upload.submit_speedup": True,
+}
+
+
+def suite_collect(npos=200, nframe=20, number=5, dut_latency=0.0005):
+    from simulated import SimTestBench
+    from collect_data import collect_akbk_for_angles, collect_ant_calib_for_angles
+
+    testbench = SimTestBench()
+    testbench.on_testrunner_started(None)
+    positions = [dict(x=x, y=0) for x in range(npos)]
+    # pipelining only overlaps file writes with waiting on the bench, so speedup is taken on a bench with latency.
+    slow = SimTestBench("sim-slow", dut_latency=dut_latency)
+    slow.on_testrunner_started(None)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        elapsed = [_best(lambda: collect_akbk_for_angles(positions[:npos // 4], nframe, output_dir=tmpdir,
+                                                         pipelined=pipelined, keep_text=False, testbench=slow),
+                         number)
+                   for pipelined in (False, True)]
+        akbk = _best(lambda: collect_akbk_for_angles(positions, nframe, output_dir=tmpdir, pipelined=True,
+                                                     keep_text=False, testbench=testbench), number)
+        output = os.path.join(tmpdir, "ant_calib.txt")
+        ant_calib = _best(lambda: collect_ant_calib_for_angles(positions, output=output, keep_text=False,
+                                                               testbench=testbench), number)
+    return {
+        "collect.akbk.positions_per_s": npos / akbk,
+        "collect.akbk.frames_per_s": npos * nframe / akbk,
+        "collect.ant_calib.positions_per_s": npos / ant_calib,
+        "collect.akbk.pipelined_speedup": elapsed[0] / elapsed[1],
+    }
+
+
+def suite_parse(number=5):
+    responses = make_ant_calib_responses()
+
+    def check():
+        rng_index = None
+        for resp in responses:
+            rng_index = check_ant_calib(resp, rng_index)
+
+    def legacy_check():
+        rng_index = None
+        for resp in responses:
+            rng_index = _legacy_check_range_and_index(resp, rng_index)
+
+    def parse():
+        for resp in responses:
+            parse_ant_calib(resp)
+
+    def legacy_extract():
+        for resp in responses:
+            _legacy_extract(resp)
+
+    elapsed = dict(check=_best(check, number), legacy_check=_best(legacy_check, number),
+                   parse=_best(parse, number), legacy_extract=_best(legacy_extract, number))
+    return {"check.ant_calib.us_per_response": elapsed["check"] / len(responses) * 1e6,
+            "parse.ant_calib.us_per_response": elapsed["parse"] / len(responses) * 1e6,
+            "check.ant_calib.speedup": elapsed["legacy_check"] / elapsed["check"],
+            "parse.ant_calib.speedup": elapsed["legacy_extract"] / elapsed["parse"]}
+
+
+class _Assertion:
+    __slots__ = ("harness", "value", "message")
+
+    def __init__(self, harness, value, message):
+        self.harness = harness
+        self.value = value
+        self.message = message
+
+    def _check(self, ok):
+        if not ok:
+            self.harness.fail(self.message)
+        return self
+
+    def is_length(self, length):
+        return self._check(len(self.value) == length)
+
+    def is_not_none(self):
+        return self._check(self.value is not None)
+
+    def is_equal_to(self, other):
+        return self._check(self.value == other)
+
+    def is_greater_than_or_equal_to(self, other):
+        return self._check(self.value >= other)
+
+
+class CheckHarness:
+    """assert_that and soft_assertions of ngta TestCase, enough to run TargetChecks outside a test runner."""
+    def __init__(self):
+        self._errors = None
+
+    def fail(self, message):
+        if self._errors is None:
+            raise AssertionError(message)
+        self._errors.append(message)
+
+    def assert_that(self, value, message=None):
+        return _Assertion(self, value, message)
+
+    @contextmanager
+    def soft_assertions(self):
+        self._errors = errors = []
+        try:
+            yield errors
+        finally:
+            self._errors = None
+        if errors:
+            raise AssertionError("\n".join(errors))
+
+
+def suite_check(nframe=1000, number=5):
+    """BaseTestCase._check_target_in_frames per frame and batch, on frames scanned from a simulated dut."""
+    from checks import TargetChecks
+    from simulated import SimDeviceAdapter
+
+    class Harness(CheckHarness, TargetChecks):
+        pass
+
+    harness = Harness()
+    frames = SimDeviceAdapter(targets=[(20.0, 0.0, 0.0), (40.0, 5.0, 10.0)], miss_rate=0.05).scan(nframe)
+    kwargs = dict(rng=20, rng_tolerance=0.5, vel=0, vel_tolerance=0.5, ang=0, ang_tolerance=1,
+                  occurrence=int(nframe * 0.9))
+
+    def check(batch):
+        try:
+            harness._check_target_ak_in_frames(frames, batch=batch, max_reported=10, **kwargs)
+        except AssertionError as e:
+            return str(e).count("\n") + 1
+        return 0
+
+    # missed frames are reported by both ways, batch only details the first 10 of them.
+    per_frame_errors, batch_errors = check(False), check(True)
+    if per_frame_errors < 10 or batch_errors != min(per_frame_errors, 10) + (per_frame_errors > 10):
+        raise AssertionError("per frame check reports {} errors, batch {}.".format(per_frame_errors, batch_errors))
+
+    per_frame, batch = _best(lambda: check(False), number), _best(lambda: check(True), number)
+    return {
+        "check.per_frame.us_per_frame": per_frame / nframe * 1e6,
+        "check.batch.us_per_frame": batch / nframe * 1e6,
+        "check.batch_speedup": per_frame / batch,
+    }
+
+
+def suite_peak(frequencies=(76.0, 76.5, 77.0), wait=1.5):
+    from base import AnalyzerTestCase
+    from simulated import SimMeasureTestBench
+
+    class Harness:
+        _measure_peak = AnalyzerTestCase._measure_peak
+        _wait_peak = AnalyzerTestCase._wait_peak
+        _zoom = AnalyzerTestCase._zoom
+        _sweep_time = AnalyzerTestCase._sweep_time
+        _wait_peak_settled = AnalyzerTestCase._wait_peak_settled
+        _fetch_peak = AnalyzerTestCase._fetch_peak
+        _select_peak = AnalyzerTestCase._select_peak
+
+        def __init__(self, testbench):
+            self.testbench = testbench
+            self.parameters = {}
+
+        def warn_(self, message):
+            pass
+
+    harness = Harness(SimMeasureTestBench())
+    result = {}
+    modes = (("fixed", dict(adaptive=False, poll_interval=0.05)),
+             ("adaptive", dict(adaptive=True, poll_interval=0.05)),
+             ("zoom", dict(adaptive=True, poll_interval=0.01, zoom_span=20e6)),
+             ("zoom_fixed", dict(adaptive=False, zoom_span=20e6)))
+    for name, options in modes:
+        start = time.perf_counter()
+        for freq in frequencies:
+            harness._measure_peak(freq, wait=wait, freq_tolerance=1e5, **options)
+        result["peak.{}.s_per_point".format(name)] = (time.perf_counter() - start) / len(frequencies)
+    result["peak.adaptive_speedup"] = result["peak.fixed.s_per_point"] / result["peak.adaptive.s_per_point"]
+    result["peak.zoom_speedup"] = result["peak.fixed.s_per_point"] / result["peak.zoom.s_per_point"]
+    result["peak.zoom_fixed_speedup"] = result["peak.fixed.s_per_point"] / result["peak.zoom_fixed.s_per_point"]
+    return result
+
+
+def suite_batch(ntx=4, latency=0.005, number=5):
+    from device import CachedDeviceAdapter
+    from simulated import SimDeviceAdapter
+
+    dut = CachedDeviceAdapter(SimDeviceAdapter(latency))
+    commands = []
+    for index in range(ntx):
+        commands += ["radio_tx on {}".format(index), "radio_txphase {} {}".format(index, 90 * index)]
+    commands.append("radio_txphase")
+
+    def sequential():
+        for cmd in commands:
+            dut.command(cmd)
+
+    def batch():
+        dut.command_batch(commands)
+
+    sequential_elapsed, batch_elapsed = _best(sequential, number), _best(batch, number)
+    return {
+        "dut.tx_config.sequential_ms": sequential_elapsed * 1e3,
+        "dut.tx_config.batch_ms": batch_elapsed * 1e3,
+        "dut.tx_config.batch_speedup": sequential_elapsed / batch_elapsed,
+    }
+
+
+def suite_shard(angles="H@-20:20:2*V@-10:10:2", nframe=5, dut_latency=0.002):
+    """
+    Collect one grid on a group of three simulated benches, one of them broken, in threads of this process and
+    with ProcessBench. Every position must be collected once, by a working bench. Speedups are over one bench
+    collecting the same grid alone.
+    """
+    from collect_data import collect_akbk_for_angles_sharded
+    from simulated import SimTestBench, collect_akbk_shard_in_process
+    from sharding import ShardedSweep, ProcessBench, run_process_shard
+    from calterah.util import get_positions_from_str
+
+    positions = get_positions_from_str(angles)
+    single = SimTestBench("sim-single", dut_latency=dut_latency)
+    single.on_testrunner_started(None)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            collect_akbk_for_angles_sharded(angles, nframe, output_dir, chunk_size=4, testbench=single)
+            single_elapsed = time.perf_counter() - start
+    finally:
+        single.on_testrunner_stopped(None)
+
+    options = dict(dut_latency=dut_latency, group="sim-shard")
+    testbench = SimTestBench("sim-shard-1", **options)
+    testbench.on_testrunner_started(None)
+    group_benches = [dict(name="sim-shard-2", dut_latency=dut_latency),
+                     dict(name="sim-shard-3", dut_latency=dut_latency, broken=True)]
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            records = collect_akbk_for_angles_sharded(angles, nframe, output_dir, chunk_size=4,
+                                                      group_benches=group_benches, testbench=testbench)
+            group_elapsed = time.perf_counter() - start
+    finally:
+        testbench.on_testrunner_stopped(None)
+    _check_shards(records, positions, "sim-shard-3")
+
+    benches = [ProcessBench("sim-process-{}".format(i), collect_akbk_shard_in_process,
+                            dict(name="sim-process-{}".format(i), dut_latency=dut_latency, nframe=nframe,
+                                 broken=i == 3))
+               for i in (1, 2, 3)]
+    try:
+        start = time.perf_counter()
+        records = ShardedSweep(benches, run_process_shard, chunk_size=4).run(positions)
+        process_elapsed = time.perf_counter() - start
+    finally:
+        for bench in benches:
+            bench.close()
+    _check_shards(records, positions, "sim-process-3")
+    try:
+        ProcessBench("sim-lambda", lambda state, items: items)
+        raise AssertionError("ProcessBench should refuse a lambda.")
+    except TypeError:
+        pass
+
+    return {
+        "shard.group.positions_per_s": len(positions) / group_elapsed,
+        "shard.process.positions_per_s": len(positions) / process_elapsed,
+        "shard.group_speedup": single_elapsed / group_elapsed,
+        "shard.process_speedup": single_elapsed / process_elapsed,
+    }
+
+
+class _LochHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        owner = self.server.owner
+        if owner.delay:
+            time.sleep(owner.delay)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if owner.status >= 300:
+            self.send_response(owner.status)
+            self.end_headers()
+            return
+        payload = json.loads(body)
+        histories = payload if isinstance(payload, list) else [payload]
+        test_type = self.path.rstrip("/").rsplit("/", 1)[-1]
+        with owner.lock:
+            ids = list(range(len(owner.received), len(owner.received) + len(histories)))
+            owner.received.extend((test_type, history) for history in histories)
+        if owner.reply == "json":
+            reply = json.dumps([dict(id=i) for i in ids] if isinstance(payload, list) else dict(id=ids[0])).encode()
+            content_type = "application/json"
+        else:
+            reply, content_type = b"OK", "text/plain"
+        self.send_response(owner.status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LochServer:
+    """
+    Local stand-in of the loch histories API: records posted histories and replies with their ids as JSON,
+    or plain text with reply='text'. Set status to an error code to simulate an outage.
+    """
+    def __init__(self, reply: str = "json", status: int = 200, delay: float = 0.0):
+        self.reply = reply
+        self.status = status
+        self.delay = delay
+        self.received = []
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _LochHandler)
+        self._server.owner = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="LochServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _check_uploaded(server, keys):
+    received = sorted(history["key"] for _, history in server.received)
+    if received != sorted(keys):
+        raise AssertionError("Server received {}, expect {} once each.".format(received, sorted(keys)))
+
+
+def suite_upload(nhistory=20, latency=0.02):
+    """
+    HistoryUploader against LochServer: submit doesn't wait for the server, every history is uploaded once,
+    an outage leaves histories spooled for the next run within close timeout, a 2xx reply that isn't JSON
+    still counts as accepted.
+    """
+    from uploader import HistoryUploader
+
+    with tempfile.TemporaryDirectory() as spool, LochServer(delay=latency) as server:
+        blocking = HistoryUploader(server.url, spool_dir=spool)
+        start = time.perf_counter()
+        for i in range(nhistory):
+            blocking.submit("sanity", dict(key="blocking-{}".format(i)))
+        blocking_elapsed = time.perf_counter() - start
+        blocking.close()
+
+        uploader = HistoryUploader(server.url, spool_dir=spool, batch_size=5)
+        uploader.start()
+        start = time.perf_counter()
+        for i in range(nhistory):
+            uploader.submit("sanity", dict(key="async-{}".format(i)))
+        submit_elapsed = time.perf_counter() - start
+        uploader.close()
+        _check_uploaded(server, ["{}-{}".format(mode, i) for mode in ("blocking", "async") for i in range(nhistory)])
+        if os.listdir(spool):
+            raise AssertionError("Spool {} isn't empty: {}".format(spool, os.listdir(spool)))
+
+    with tempfile.TemporaryDirectory() as spool, LochServer(status=503) as server:
+        uploader = HistoryUploader(server.url, spool_dir=spool, retries=3, backoff=0.5, timeout=1)
+        uploader.start()
+        for i in range(3):
+            uploader.submit("sanity", dict(key="outage-{}".format(i)))
+        start = time.perf_counter()
+        uploader.close(timeout=1)
+        if time.perf_counter() - start > 2:
+            raise AssertionError("close during outage took {:.1f}s.".format(time.perf_counter() - start))
+        server.status = 200
+        uploader = HistoryUploader(server.url, spool_dir=spool)
+        uploader.start()
+        uploader.close()
+        _check_uploaded(server, ["outage-{}".format(i) for i in range(3)])
+
+    with tempfile.TemporaryDirectory() as spool, LochServer(reply="text") as server:
+        for _ in range(2):
+            uploader = HistoryUploader(server.url, spool_dir=spool, batch_size=2)
+            uploader.start()
+            if not server.received:
+                for i in range(4):
+                    uploader.submit("sanity", dict(key="text-{}".format(i)))
+            uploader.close()
+        _check_uploaded(server, ["text-{}".format(i) for i in range(4)])
+
+    return {"upload.submit_speedup": blocking_elapsed / submit_elapsed}
+
+
+def _check_shards(records, positions, broken):
+    if [record.item for record in records] != list(positions):
+        raise AssertionError("Sharded records don't cover positions in order.")
+    used = {record.provenance["bench"] for record in records}
+    if broken in used or len(used) != 2:
+        raise AssertionError("Positions should be collected by the 2 working benches, not {}.".format(used))
+
+
+def run_suite(names=("collect", "parse", "check", "peak", "batch", "shard", "upload")) -> dict:
+    funcs = dict(collect=suite_collect, parse=suite_parse, check=suite_check, peak=suite_peak, batch=suite_batch,
+                 shard=suite_shard, upload=suite_upload)
+    result = {}
+    for name in names:
+        try:
+            result.update(funcs[name]())
+        except ImportError as e:
+            # simulated benches subclass the ngta/calterah ones, skip what can't run without them.
+            if e.name is None or e.name.split(".")[0] not in OPTIONAL_PACKAGES:
+                raise
+            print("skip {}: {} is not installed".format(name, e.name))
+    return result
+
+
+def compare_with_baseline(result: dict, baseline: dict, tolerance: float = 0.25) -> list:
+    regressions = []
+    for metric, value in sorted(result.items()):
+        base = baseline.get(metric)
+        if metric not in SUITE_METRICS:
+            status = "info"
+        elif base is None:
+            status = "new"
+        elif SUITE_METRICS[metric]:
+            status = "REGRESSION" if value < base * (1 - tolerance) else "ok"
+        else:
+            status = "REGRESSION" if value > base * (1 + tolerance) else "ok"
+        if status == "REGRESSION":
+            regressions.append(metric)
+        print("{:36s} {:12.3f} baseline {:>12s} {}".format(
+            metric, value, "-" if base is None else "{:.3f}".format(base), status))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="micro benchmarks for alps collection hot paths.")
+    subparsers = parser.add_subparsers(dest="name", required=True)
+    ant_calib = subparsers.add_parser("ant_calib", help="ant_calib response parse and check.")
+    ant_calib.add_argument("--input", help="output file of collect_ant_calib_for_angles, synthetic if omitted.")
+    ant_calib.add_argument("--number", type=int, default=5)
+    suite = subparsers.add_parser("suite", help="simulated bench throughput, speedups compared with stored baseline.")
+    suite.add_argument("--only", nargs="+", choices=["collect", "parse", "check", "peak", "batch", "shard", "upload"],
+                       default=["collect", "parse", "check", "peak", "batch", "upload"])
+    suite.add_argument("--baseline", default=BASELINE_PATH)
+    suite.add_argument("--save-baseline", action="store_true")
+    suite.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    if args.name == "suite":
+        result = run_suite(args.only)
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if args.save_baseline:
+            baseline.update((metric, value) for metric, value in result.items() if metric in SUITE_METRICS)
+            with open(args.baseline, "w") as f:
+                json.dump(baseline, f, indent=2, sort_keys=True)
+            print("Save baseline to {}".format(args.baseline))
+        elif regressions:
+            sys.exit(1)
+
+    elif args.name == "ant_calib":
+        if args.input:
+            bench_ant_calib(load_ant_calib_responses(args.input), args.number, args.input)
+        else:
+            responses = make_ant_calib_responses()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, "ant_calib.txt")
+                with open(path, "w") as f:
+                    f.write("".join(responses))
+                bench_ant_calib(responses, args.number, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# coding: utf-8
+
+"""
+Antenna calibration of collected H/V sweeps with ant_calib of radar_plot_routines, and a streaming estimate
+of one sweep from parsed ant_calib records (see parsers.parse_ant_calib_text) to stop collecting early.
+
+The streaming estimate models phase of channel ch at angle t relative to channel 0 as
+
+    phase[ch] = 360 * pos[ch] * sin(t) + comp[ch]    (degree)
+
+it only decides when a sweep has enough data, calibration results come from ant_calib.
+"""
+
+import os
+import tempfile
+from collections import namedtuple
+from typing import List
+
+import numpy as np
+
+from parsers import parse_ant_prog
+
+import logging
+logger = logging.getLogger(__name__)
+
+DirectionCalibration = namedtuple("DirectionCalibration", ["axis", "npos", "pos", "comp", "residual"])
+AntCalibResult = namedtuple("AntCalibResult", ["pos", "comp", "text"])
+
+AXIS_FIELDS = {"h": "x", "v": "y"}
+
+
+def run_ant_calib(h_text: str, v_text: str, h_tx_groups: List[int], v_tx_groups: List[int],
+                  h_ants_groups=None, v_ants_groups=None, adjust_angle=None) -> AntCalibResult:
+    """
+    Run ant_calib on texts collected by collect_ant_calib_for_angles, return the 'ant_prog pos' and
+    'ant_prog comp' it prints as arrays. ant_calib only reads files, texts are handed over in a temporary
+    directory which is removed afterwards.
+    """
+    from radar_plot_routines import ant_calib
+    from coupling.dict import AttrDict
+
+    # texts go to ant_calib as collected, prompts and other console lines included, it has its own parser.
+    for axis, text in (("h", h_text), ("v", v_text)):
+        if not text.strip():
+            raise ValueError("{} sweep has no ant_calib response.".format(axis))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h_filename = os.path.join(tmpdir, "h_ant_calib.txt")
+        v_filename = os.path.join(tmpdir, "v_ant_calib.txt")
+        for filename, text in ((h_filename, h_text), (v_filename, v_text)):
+            with open(filename, "w") as f:
+                f.write(text)
+
+        args = AttrDict(
+            h_filename=h_filename,
+            v_filename=v_filename,
+            h_tx_groups=h_tx_groups,
+            v_tx_groups=v_tx_groups,
+            h_ants_groups=h_ants_groups,
+            v_ants_groups=v_ants_groups,
+            output_dir=None,
+            adjust_angle=adjust_angle,
+        )
+        resp = ant_calib.main(args)
+    logger.debug(resp)
+    return AntCalibResult(parse_ant_prog(resp, "pos"), parse_ant_prog(resp, "comp"), resp)
+
+
+def wrap_phase(deg):
+    return (np.asarray(deg) + 180.0) % 360.0 - 180.0
+
+
+class DirectionFit:
+    """
+    Least squares fit of relative phase against sin(angle) for every channel of one sweep direction, from
+    running sums of the normal equations so adding a response costs the same at any point of the sweep.
+    Lines of one position are averaged first, responses should come in sweep order as phase is unwrapped
+    against the previous position.
+    """
+    def __init__(self, axis: str = "h"):
+        self.axis = axis
+        self.angles = set()
+        self._nline = 0
+        self._last_phase = np.zeros(0)
+        # per channel: count, sum of x, x*x, y, x*y, y*y with x = 360 * sin(angle), y = unwrapped phase.
+        self._sums = np.zeros((6, 0))
+
+    def __len__(self):
+        return self._nline
+
+    def _grow(self, nchannel):
+        if nchannel > self._sums.shape[1]:
+            self._sums = np.pad(self._sums, ((0, 0), (0, nchannel - self._sums.shape[1])))
+            self._last_phase = np.pad(self._last_phase, (0, nchannel - len(self._last_phase)),
+                                      constant_values=np.nan)
+
+    def add(self, records: np.ndarray):
+        if records is None or not len(records):
+            return
+        self._nline += len(records)
+        angles = records[AXIS_FIELDS[self.axis]]
+        values = records["values"]
+        relative = wrap_phase(values - values[:, :1])
+        valid = ~np.isnan(relative)
+        phasors = np.where(valid, np.exp(1j * np.radians(np.where(valid, relative, 0))), 0)
+        self._grow(values.shape[1])
+        for angle in dict.fromkeys(angles.tolist()):
+            rows = angles == angle
+            phase = np.where(valid[rows].any(axis=0), np.degrees(np.angle(phasors[rows].sum(axis=0))), np.nan)
+            self._add_position(angle, phase)
+
+    def _add_position(self, angle, phase):
+        nchannel = len(phase)
+        last = self._last_phase[:nchannel]
+        phase = np.where(np.isnan(last), phase, last + wrap_phase(phase - last))
+        ok = ~np.isnan(phase)
+        y = np.where(ok, phase, 0.0)
+        x = 360.0 * np.sin(np.radians(angle))
+        self._sums[:, :nchannel] += np.stack([ok, x * ok, x * x * ok, y, x * y, y * y])
+        self._last_phase[:nchannel] = np.where(ok, phase, last)
+        self.angles.add(angle)
+
+    def result(self) -> DirectionCalibration:
+        n, sx, sxx, sy, sxy, syy = self._sums
+        with np.errstate(divide="ignore", invalid="ignore"):
+            det = n * sxx - sx * sx
+            fitted = det > 1e-9 * np.maximum(n * sxx, 1)
+            pos = np.where(fitted, (n * sxy - sx * sy) / det, np.nan)
+            comp = np.where(fitted, (sy - np.where(fitted, pos, 0) * sx) / n, sy / n)
+            residual = np.sqrt(np.maximum(syy - np.where(fitted, pos, 0) * sxy - comp * sy, 0) / n)
+        return DirectionCalibration(self.axis, len(self.angles), pos, wrap_phase(comp), residual)
+
+
+COLLECTING = "collecting"
+CONVERGED = "converged"
+DIVERGED = "diverged"
+
+FitProgress = namedtuple("FitProgress", ["state", "npos", "delta_pos", "delta_comp", "residual", "calibration"])
+
+
+class StreamingDirectionFit(DirectionFit):
+    """
+    Update the fit after every ant_calib response of a sweep. Converged when pos and comp moved less than tolerance for
+    stable_count updates in a row, diverged when fit residual (degree rms of the worst channel) exceeds
+    max_residual, e.g. a drifting phase. Both need min_positions distinct angles.
+    """
+    def __init__(self, axis: str = "h", pos_tolerance: float = 0.01, comp_tolerance: float = 1.0,
+                 stable_count: int = 3, min_positions: int = 5, max_residual: float = 10.0):
+        super().__init__(axis)
+        self.pos_tolerance = pos_tolerance
+        self.comp_tolerance = comp_tolerance
+        self.stable_count = stable_count
+        self.min_positions = min_positions
+        self.max_residual = max_residual
+        self.history = []
+        self._stable = 0
+        self._last = None
+
+    def update(self, records: np.ndarray) -> FitProgress:
+        self.add(records)
+        npos = len(self.angles)
+        if npos < 2:
+            progress = FitProgress(COLLECTING, npos, np.nan, np.nan, np.nan, None)
+            self.history.append(progress)
+            return progress
+
+        calibration = self.result()
+        delta_pos = delta_comp = np.nan
+        if self._last is not None:
+            delta_pos = np.nanmax(np.abs(calibration.pos - self._last.pos))
+            delta_comp = np.nanmax(np.abs(wrap_phase(calibration.comp - self._last.comp)))
+        self._last = calibration
+        residual = np.nanmax(calibration.residual)
+
+        if delta_pos <= self.pos_tolerance and delta_comp <= self.comp_tolerance:
+            self._stable += 1
+        else:
+            self._stable = 0
+
+        state = COLLECTING
+        if npos >= self.min_positions:
+            if residual > self.max_residual:
+                state = DIVERGED
+            elif self._stable >= self.stable_count:
+                state = CONVERGED
+        progress = FitProgress(state, npos, delta_pos, delta_comp, residual, calibration)
+        self.history.append(progress)
+        return progress
@@ -0,0 +1,131 @@
+# coding: utf-8
+
+"""
+Compact binary capture of alps frames.
+
+Layout:  MAGIC | uint32 header size | json header | padding | frame table | target records
+
+The frame table has one FRAME_DTYPE record per frame, `start` indexes the first ak target in the target
+records, bk targets follow the ak ones. Both arrays are aligned to 8 bytes so the reader can map them as views.
+"""
+
+import json
+import struct
+import itertools
+from operator import attrgetter
+import numpy as np
+
+from timing import span
+
+MAGIC = b"ALPSCAP1"
+EXTENSION = ".cap"
+ALIGNMENT = 8
+
+FRAME_DTYPE = np.dtype([("idx", "<u4"), ("start", "<u4"), ("n_ak", "<u2"), ("n_bk", "<u2")])
+TARGET_DTYPE = np.dtype([("rng", "<f4"), ("vel", "<f4"), ("ang", "<f4")])
+TRACK_MODES = ("ak", "bk")
+
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+
+def _tracked(frame, mode):
+    """Targets tracked by `mode`, a frame without any has None."""
+    tracked = getattr(frame, mode)
+    return [] if tracked is None else tracked
+
+
+def _records(targets: list, dtype) -> np.ndarray:
+    """Records of dtype from target objects, every field is read from the attribute of the same name."""
+    get = attrgetter(*dtype.names)
+    values = np.array([get(target) for target in targets], dtype=float).reshape(len(targets), len(dtype.names))
+    records = np.empty(len(targets), dtype=dtype)
+    for i, name in enumerate(dtype.names):
+        records[name] = values[:, i]
+    return records
+
+
+def frames_to_arrays(frames):
+    """Convert frames to (frame table, target records)."""
+    ak = [_tracked(frame, "ak") for frame in frames]
+    bk = [_tracked(frame, "bk") for frame in frames]
+    table = np.zeros(len(frames), dtype=FRAME_DTYPE)
+    table["idx"] = [frame.idx for frame in frames]
+    table["n_ak"] = [len(tracked) for tracked in ak]
+    table["n_bk"] = [len(tracked) for tracked in bk]
+    sizes = table["n_ak"].astype(np.int64) + table["n_bk"]
+    table["start"] = np.cumsum(sizes) - sizes
+    targets = _records([target for a, b in zip(ak, bk) for target in itertools.chain(a, b)], TARGET_DTYPE)
+    return table, targets
+
+
+def mode_to_arrays(frames, mode="ak", dtype=TARGET_DTYPE):
+    """Convert targets tracked by `mode` to (per-frame target count, target records)."""
+    tracked = [_tracked(frame, mode) for frame in frames]
+    counts = np.fromiter(map(len, tracked), dtype=np.int64, count=len(tracked))
+    return counts, _records([target for targets in tracked for target in targets], dtype)
+
+
+def write_capture(path, frames, **metadata):
+    table, targets = frames_to_arrays(frames)
+    header = dict(metadata, nframe=len(table), ntarget=len(targets),
+                  frame_dtype=FRAME_DTYPE.descr, target_dtype=TARGET_DTYPE.descr)
+    header = json.dumps(header, default=str).encode("utf-8")
+    prefix = len(MAGIC) + 4 + len(header)
+
+    with span("file.write"), open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * _padding(prefix))
+        f.write(table.tobytes())
+        f.write(b"\0" * _padding(table.nbytes))
+        f.write(targets.tobytes())
+    return path
+
+
+class Capture:
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError("{} is not an alps capture file.".format(path))
+
+        offset = len(MAGIC)
+        header_size, = struct.unpack("<I", bytes(self._buffer[offset:offset + 4]))
+        offset += 4
+        self.meta = json.loads(bytes(self._buffer[offset:offset + header_size]).decode("utf-8"))
+        offset += header_size
+        offset += _padding(offset)
+
+        size = self.meta["nframe"] * FRAME_DTYPE.itemsize
+        self.frames = self._buffer[offset:offset + size].view(FRAME_DTYPE)
+        offset += size + _padding(size)
+
+        size = self.meta["ntarget"] * TARGET_DTYPE.itemsize
+        self.targets = self._buffer[offset:offset + size].view(TARGET_DTYPE)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return "<{}(path:{}, nframe:{})>".format(self.__class__.__name__, self.path, len(self))
+
+    def targets_of(self, index, mode="ak"):
+        frame = self.frames[index]
+        start = int(frame["start"])
+        if mode == "bk":
+            start += int(frame["n_ak"])
+        return self.targets[start:start + int(frame["n_" + mode])]
+
+    def mode_mask(self, mode="ak"):
+        """Boolean mask over target records selecting targets tracked by `mode`."""
+        n_ak = self.frames["n_ak"].astype(np.int64)
+        n_bk = self.frames["n_bk"].astype(np.int64)
+        is_ak = np.repeat(np.tile([True, False], len(self)), np.column_stack([n_ak, n_bk]).ravel())
+        return is_ak if mode == "ak" else ~is_ak
+
+
+def load_capture(path) -> Capture:
+    return Capture(path)
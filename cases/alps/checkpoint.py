@@ -0,0 +1,143 @@
+# coding: utf-8
+
+"""
+Checkpoint manifest of a collection sweep, stored next to its output as '<output>.manifest'.
+
+The manifest is JSON lines: a header with sweep settings and base offset of the sweep in output, the locked
+rng_index, then one line per completed position with offset, size and crc32 of its bytes in the output. It is
+only appended, so a crash leaves at most one partial line, which is ignored on resume like any entry not
+matching the output file. When it is rewritten on open, a new one replaces it as a whole.
+
+Output is appended to: bytes before base, e.g. earlier runs written without checkpoint, are never cut.
+"""
+
+import os
+import json
+import zlib
+
+import logging
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest"
+
+
+def _pos_key(pos):
+    return float(pos["x"]), float(pos["y"])
+
+
+class Checkpoint:
+    def __init__(self, output: str, **settings):
+        self.output = output
+        self.path = output + MANIFEST_SUFFIX
+        self.settings = settings
+        self.rng_index = None
+        self.base = 0
+        self.entries = []
+        self._done = set()
+        self._manifest = None
+
+    @property
+    def size(self):
+        return self.entries[-1]["offset"] + self.entries[-1]["size"] if self.entries else self.base
+
+    def is_done(self, pos) -> bool:
+        return _pos_key(pos) in self._done
+
+    def _load(self) -> bool:
+        """Keep leading entries whose bytes are still intact in output, return False without a usable manifest."""
+        if not os.path.exists(self.path) or not os.path.exists(self.output):
+            return False
+        with open(self.path) as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            logger.warning("Ignore unreadable checkpoint %s", self.path)
+            return False
+        if header.get("settings") != self.settings:
+            raise ValueError("Checkpoint {} was made with {}, not {}".format(self.path, header.get("settings"),
+                                                                              self.settings))
+        self.base = header.get("base", 0)
+        if self.base > os.path.getsize(self.output):
+            logger.warning("Output %s is shorter than checkpoint %s, ignore it.", self.output, self.path)
+            self.base = 0
+            return False
+
+        with open(self.output, "rb") as f:
+            for line in lines[1:]:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get("rng_index") is not None:
+                    self.rng_index = entry["rng_index"]
+                    continue
+                f.seek(entry["offset"])
+                data = f.read(entry["size"])
+                if entry["offset"] != self.size or len(data) != entry["size"] or zlib.crc32(data) != entry["crc32"]:
+                    logger.warning("Checkpoint entry X%sY%s doesn't match %s, redo from it.",
+                                   entry["x"], entry["y"], self.output)
+                    break
+                self.entries.append(entry)
+                self._done.add(_pos_key(entry))
+        return True
+
+    def open(self, resume: bool = False, fresh: bool = False):
+        """
+        Return output opened for appending binary data. With resume, it is truncated after the last completed
+        position of the manifest. Without a manifest to resume from, existing output is kept and the sweep is
+        appended after it. With fresh, output is emptied first.
+        """
+        exists = os.path.exists(self.output)
+        if fresh:
+            exists = False
+        elif resume and self._load():
+            logger.info("Resume %s: %d positions done, rng_index %s.", self.output, len(self.entries), self.rng_index)
+        elif exists:
+            self.base = os.path.getsize(self.output)
+            if resume:
+                logger.warning("No checkpoint of %s to resume, keep its %d bytes and append all positions.",
+                               self.output, self.base)
+        f = open(self.output, "r+b" if exists else "wb")
+        f.truncate(self.size)
+        f.seek(self.size)
+
+        # write verified entries to a new manifest and replace the old one as a whole, later ones are appended.
+        temp = self.path + ".tmp"
+        with open(temp, "w") as manifest:
+            manifest.write(json.dumps(dict(settings=self.settings, base=self.base)) + "\n")
+            if self.rng_index is not None:
+                manifest.write(json.dumps(dict(rng_index=self.rng_index)) + "\n")
+            for entry in self.entries:
+                manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+        os.replace(temp, self.path)
+        self._manifest = open(self.path, "a")
+        return f
+
+    def _append(self, entry: dict):
+        self._manifest.write(json.dumps(entry) + "\n")
+        self._manifest.flush()
+
+    def read_completed(self) -> bytes:
+        with open(self.output, "rb") as f:
+            f.seek(self.base)
+            return f.read(self.size - self.base)
+
+    def lock_rng_index(self, rng_index):
+        if rng_index is not None and self.rng_index is None:
+            self.rng_index = int(rng_index)
+            self._append(dict(rng_index=self.rng_index))
+
+    def add(self, pos, data: bytes):
+        """Call after data of pos is flushed to output."""
+        entry = dict(x=pos["x"], y=pos["y"], offset=self.size, size=len(data), crc32=zlib.crc32(data))
+        self.entries.append(entry)
+        self._done.add(_pos_key(pos))
+        self._append(entry)
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
@@ -0,0 +1,132 @@
+# coding: utf-8
+
+"""
+Checks of a target tracked in captured frames. TargetChecks only needs assert_that and soft_assertions of
+ngta TestCase, firmware testcases mix it in and benchmarks run it on a harness.
+"""
+
+from typing import Union
+from collections import namedtuple
+from calterah.adapters.alps import Frame, TrackMode, get_standard_tolerance
+import numpy as np
+
+from capture import mode_to_arrays, TARGET_DTYPE
+
+ToleranceType = Union[int, float, list, tuple]
+TrackModeType = Union[TrackMode, str]
+
+
+def get_trace_mode_str(mode: TrackModeType):
+    mode = mode.value if isinstance(mode, TrackMode) else mode
+    return mode.lower()
+
+
+# match with double precision, same as comparing parsed python floats in Frame.find_target.
+MATCH_DTYPE = np.dtype([(name, "<f8") for name in TARGET_DTYPE.names])
+FramesMatch = namedtuple("FramesMatch", ["found", "length_ok", "occurrence"])
+
+
+def _in_tolerance(values, expect, tolerance):
+    """tolerance is the signed (lower, upper) offset from expect returned by get_standard_tolerance."""
+    lower, upper = tolerance
+    return (values >= expect + lower) & (values <= expect + upper)
+
+
+def match_target_in_frames(frames, mode: TrackModeType, *,
+                           num_of_tracked_targets: int = None,
+                           rng, rng_tolerance: ToleranceType = 0,
+                           vel, vel_tolerance: ToleranceType = 0,
+                           ang=None, ang_tolerance: ToleranceType = 0) -> FramesMatch:
+    """
+    Vectorized equivalent of checking every frame with Frame.find_target, return per-frame masks and
+    the occurrence counted the same way as soft assertion errors in BaseTestCase._check_target_in_frames.
+    """
+    counts, targets = mode_to_arrays(frames, get_trace_mode_str(mode), MATCH_DTYPE)
+    hits = _in_tolerance(targets["rng"], rng, get_standard_tolerance(rng_tolerance))
+    hits &= _in_tolerance(targets["vel"], vel, get_standard_tolerance(vel_tolerance))
+    if ang is not None:
+        hits &= _in_tolerance(targets["ang"], ang, get_standard_tolerance(ang_tolerance))
+
+    frame_ids = np.repeat(np.arange(len(frames)), counts)
+    found = np.bincount(frame_ids[hits], minlength=len(frames)) > 0
+    if num_of_tracked_targets is None:
+        length_ok = np.ones(len(frames), dtype=bool)
+    else:
+        length_ok = counts == num_of_tracked_targets
+    occurrence = len(frames) - int(np.count_nonzero(~found)) - int(np.count_nonzero(~length_ok))
+    return FramesMatch(found, length_ok, occurrence)
+
+
+class TargetChecks:
+    def _check_frame(self, frame: Frame, mode: TrackModeType, *,
+                     num_of_tracked_targets: int = None,
+                     rng, rng_tolerance: ToleranceType = 0,
+                     vel, vel_tolerance: ToleranceType = 0,
+                     ang=None, ang_tolerance: ToleranceType = 0):
+        mode = get_trace_mode_str(mode)
+        tracked_targets = getattr(frame, mode)
+        if num_of_tracked_targets is not None:
+            message = 'frame {} should only tracked one object.'.format(frame.idx)
+            self.assert_that(tracked_targets, message).is_length(num_of_tracked_targets)
+
+        rng_tolerance = get_standard_tolerance(rng_tolerance)
+        vel_tolerance = get_standard_tolerance(vel_tolerance)
+        ang_tolerance = get_standard_tolerance(ang_tolerance)
+
+        found = frame.find_target(mode,
+                                  rng=rng, rng_tolerance=rng_tolerance,
+                                  vel=vel, vel_tolerance=vel_tolerance,
+                                  ang=ang, ang_tolerance=ang_tolerance)
+        message = 'Frame {} should find target with: rng {}{}, vel {}{}, ang {}{}'.format(
+            frame.idx, rng, rng_tolerance, vel, vel_tolerance, ang, ang_tolerance)
+        self.assert_that(found, message).is_not_none()
+
+    def _check_target_in_frames(self, frames, mode: TrackModeType, occurrence: int = None, batch: bool = False,
+                                max_reported: int = None, **kwargs):
+        if batch:
+            self._check_target_in_frames_batch(frames, mode, occurrence, max_reported, **kwargs)
+            return
+
+        with self.soft_assertions() as errors:
+            for frame in frames:
+                self._check_frame(frame, mode, **kwargs)
+
+            if occurrence:
+                actual_occurrence = len(frames) - len(errors)
+                message = 'Target should be occurred greater than or equal to {}'.format(occurrence)
+                self.assert_that(actual_occurrence, message).is_greater_than_or_equal_to(occurrence)
+
+    def _check_target_in_frames_batch(self, frames, mode: TrackModeType, occurrence: int = None,
+                                      max_reported: int = None, **kwargs):
+        result = match_target_in_frames(frames, mode, **kwargs)
+        failed = np.flatnonzero(~result.found | ~result.length_ok)
+        reported = failed if max_reported is None else failed[:max_reported]
+
+        with self.soft_assertions():
+            mode = get_trace_mode_str(mode)
+            for index in reported:
+                frame = frames[index]
+                if not result.length_ok[index]:
+                    message = 'frame {} should only tracked one object.'.format(frame.idx)
+                    self.assert_that(getattr(frame, mode), message).is_length(kwargs["num_of_tracked_targets"])
+                if not result.found[index]:
+                    message = 'Frame {} should find target with: rng {}{}, vel {}{}, ang {}{}'.format(
+                        frame.idx,
+                        kwargs["rng"], get_standard_tolerance(kwargs.get("rng_tolerance", 0)),
+                        kwargs["vel"], get_standard_tolerance(kwargs.get("vel_tolerance", 0)),
+                        kwargs.get("ang"), get_standard_tolerance(kwargs.get("ang_tolerance", 0)))
+                    self.assert_that(None, message).is_not_none()
+
+            if len(failed) > len(reported):
+                message = '{} more frames failed, not reported in detail.'.format(len(failed) - len(reported))
+                self.assert_that(len(failed) - len(reported), message).is_equal_to(0)
+
+            if occurrence:
+                message = 'Target should be occurred greater than or equal to {}'.format(occurrence)
+                self.assert_that(result.occurrence, message).is_greater_than_or_equal_to(occurrence)
+
+    def _check_target_bk_in_frames(self, frames, **kwargs):
+        self._check_target_in_frames(frames, 'bk', **kwargs)
+
+    def _check_target_ak_in_frames(self, frames, **kwargs):
+        self._check_target_in_frames(frames, 'ak', **kwargs)
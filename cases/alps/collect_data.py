@@ -1,74 +1,127 @@
 # coding: utf-8
 
-import re
 import os
-import time
+from typing import Callable, List
 from ngta import current_context
 from calterah.util import get_positions_from_str
 from bench import TestBench
+import capture
+import timing
+from parsers import parse_ant_calib, parse_ant_calib_text, check_ant_calib, check_range_and_index, concat_ant_calib
+from checkpoint import Checkpoint
+from calibration import StreamingDirectionFit, COLLECTING
+from adaptive import AdaptiveSampler, ANT_CALIB_METRIC, AKBK_METRIC
+from motion import MotionPlanner, Plan
+from pipeline import StageTimer, BackgroundWriter, ResultCollector, write_file
+from sharding import ShardedSweep, expand_iterations, save_dataset, benches_in_group, group_of, started
+from targets import order_iterations, count_target_commands
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-def collect_akbk_for_angles(angles, nframe, interval=None, output_dir=None):
+def _goto(testbench, angles, pos):
+    if isinstance(angles, Plan):
+        angles.move(testbench.rot, pos)
+    else:
+        testbench.rot.goto(**pos)
+
+
+def _label(angles, pos):
+    return angles.label(pos) if isinstance(angles, Plan) else None
+
+
+def _adaptive_sampler(angles, adaptive) -> AdaptiveSampler:
+    """adaptive is a sampler or its options, e.g. {coarse: 8, error_target: 5, budget: 500}."""
+    if adaptive is None or isinstance(adaptive, AdaptiveSampler):
+        return adaptive
+    return AdaptiveSampler(angles, **adaptive)
+
+
+def iter_akbk_for_angles(angles, nframe, interval=None, timer: StageTimer = None, testbench: TestBench = None):
+    """angles can be a motion.Plan, moves are then timed by it."""
     if isinstance(angles, str):
         angles = get_positions_from_str(angles)
 
-    context = current_context()
-    testbench: TestBench = context.testbench
-    text = ''
+    testbench = testbench or current_context().testbench
+    timer = timer or StageTimer()
     for pos in angles:
-        testbench.rot.goto(**pos)
+        with timer.stage("goto"):
+            _goto(testbench, angles, pos)
         if interval is not None:
-            time.sleep(interval)
-        frames = testbench.dut.scan(nframe)
+            with timer.stage("settle"):
+                timing.sleep(interval)
+        with timer.stage("scan"):
+            frames = testbench.dut.scan(nframe)
+        yield pos, frames
 
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-            output = os.path.join(output_dir, "X{}Y{}.txt".format(pos["x"], pos["y"]))
-            with open(output, "w") as f:
-                f.write(frames.raw)
-        text += frames.raw
-    logger.debug("data: \n%s", text)
-    return text
-
-
-def _check_range_and_index(text, rng_index):
-    lines = text.strip().split('\n')
-    for line in lines[1:]:
-        # check rng_index should always be same during test.
-        match = re.search(r'rng_index (\d+)', line)
-        new_rng_index = match.group(1)
-        if rng_index is None:
-            rng_index = new_rng_index
-        else:
-            if rng_index != new_rng_index:
-                raise AssertionError("rng_index is not match")
 
-        # check range should not be 0.00
-        no_range = re.search(r'range 0.00', line)
-        if no_range:
-            raise AssertionError("range should not be 0.00")
-    return rng_index
+def collect_akbk_for_angles(angles, nframe, interval=None, output_dir=None, pipelined=False, queue_size=8,
+                            keep_text=True, sink=None, fmt="txt", planner: MotionPlanner = None,
+                            adaptive=None, testbench: TestBench = None):
+    """With adaptive, only positions of the grid picked by AdaptiveSampler are collected, see adaptive.py."""
+    testbench = testbench or current_context().testbench
+    sampler = _adaptive_sampler(angles, adaptive)
+    if sampler:
+        angles = sampler
+    elif planner:
+        angles = planner.plan(angles)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # in pipelined mode, files are written by background worker, so next goto starts right after scan.
+    timer = StageTimer()
+    writer = BackgroundWriter(queue_size, timer) if pipelined else None
+    if writer:
+        writer.start()
+
+    collector = ResultCollector("akbk", keep=keep_text, sink=sink)
+    try:
+        for pos, frames in iter_akbk_for_angles(angles, nframe, interval, timer, testbench):
+            if output_dir and fmt == "bin":
+                output = os.path.join(output_dir, "X{}Y{}{}".format(pos["x"], pos["y"], capture.EXTENSION))
+                if writer:
+                    writer.submit(capture.write_capture, output, frames, pos=pos, sensor_cfg=testbench.sensor_cfg)
+                else:
+                    with timer.stage("write"):
+                        capture.write_capture(output, frames, pos=pos, sensor_cfg=testbench.sensor_cfg)
+            elif output_dir:
+                output = os.path.join(output_dir, "X{}Y{}.txt".format(pos["x"], pos["y"]))
+                if writer:
+                    writer.write(output, frames.raw)
+                else:
+                    with timer.stage("write"):
+                        write_file(output, frames.raw)
+            if sampler:
+                sampler.add(pos, frames, AKBK_METRIC)
+            collector.add(pos, frames.raw, _label(angles, pos))
+    finally:
+        if writer:
+            writer.close()
+    timer.log("collect_akbk_for_angles")
+    return collector.result()
 
 
-def collect_ant_calib_for_angles(angles, range_min=None, range_max=None, ignore_error=False, interval=None, output=None):
+def iter_ant_calib_for_angles(angles, range_min=None, range_max=None, ignore_error=False, interval=None, parse=False,
+                              rng_index=None, on_rng_index: Callable[[int], None] = None,
+                              testbench: TestBench = None):
+    """
+    Yield (pos, response, records) per position, records only with parse. Unless ignore_error, responses are
+    checked: parsed records with check_range_and_index, else the text with check_ant_calib. on_rng_index is
+    called once when rng_index is known from the first checked response.
+    """
     if isinstance(angles, str):
         angles = get_positions_from_str(angles)
 
-    context = current_context()
-    testbench: TestBench = context.testbench
+    testbench = testbench or current_context().testbench
 
     repeat = 1
 
     # call ant_calib to get raw data
-    text = ''
-    rng_index = None
     for pos in angles:
-        testbench.rot.goto(**pos)
+        _goto(testbench, angles, pos)
         if interval is not None:
-            time.sleep(interval)
+            timing.sleep(interval)
         for i in range(repeat):
             c = 'ant_calib X{}Y{}'.format(pos["x"], pos["y"])
             if range_min:
@@ -76,39 +129,251 @@ def collect_ant_calib_for_angles(angles, range_min=None, range_max=None, ignore_
             if range_max:
                 c += " {}".format(range_max)
             resp = testbench.dut.command(c, timeout=2)
-            if not ignore_error:
-                rng_index = _check_range_and_index(resp, rng_index)
+            records = None
+            locked = rng_index
+            # validate parsed records when there are some, the text only when values aren't needed.
+            if parse:
+                try:
+                    records = parse_ant_calib(resp, pos)
+                except ValueError as e:
+                    if not ignore_error:
+                        raise AssertionError("X{}Y{}: {}".format(pos["x"], pos["y"], e)) from e
+                    logger.warning("X%sY%s: %s", pos["x"], pos["y"], e)
+                else:
+                    if not ignore_error:
+                        rng_index = check_range_and_index(records, rng_index)
+            elif not ignore_error:
+                rng_index = check_ant_calib(resp, rng_index)
+            if locked is None and rng_index is not None and on_rng_index:
+                on_rng_index(rng_index)
 
             if i == 1:
                 resp = "\n".join(resp.split('\n')[1:])
+            yield pos, resp, records
+
+
+def collect_ant_calib_for_angles(angles, range_min=None, range_max=None, ignore_error=False, interval=None, output=None,
+                                 keep_text=True, sink=None, as_array=False, checkpoint=False, resume=False,
+                                 fresh=False, planner: MotionPlanner = None, adaptive=None,
+                                 testbench: TestBench = None):
+    """
+    With checkpoint, completed positions are recorded in a manifest next to output. With resume, positions
+    already in the manifest are skipped, a partial tail of output is cut and the locked rng_index is kept.
+    Output is appended to as without checkpoint, unless fresh empties it first.
+
+    With planner, positions are visited in planned order and output has them in that order, every response
+    starts with its echoed 'ant_calib X..Y..'. Returned text or array is put back in the given order,
+    after the ones completed before resume.
+
+    With adaptive, only positions of the grid picked by AdaptiveSampler are collected, it can't be resumed.
+    """
+    if (checkpoint or resume or fresh) and not output:
+        raise ValueError("checkpoint needs output file.")
+    if fresh and resume:
+        raise ValueError("fresh output can't be resumed.")
+    if adaptive is not None and resume:
+        raise ValueError("adaptive sampling depends on collected data, it can't be resumed.")
+    sampler = _adaptive_sampler(angles, adaptive)
 
-            if output:
-                with open(output, "a") as f:
+    collector = ResultCollector("ant_calib", keep=keep_text and not as_array, sink=sink)
+    arrays = []
+    previous = ""
+    rng_index = None
+    cp = None
+    if checkpoint or resume:
+        # manifest of another grid must not be resumed, positions are stored as loaded back from JSON.
+        grid = angles if isinstance(angles, str) else [[float(pos["x"]), float(pos["y"])] for pos in angles]
+        cp = Checkpoint(output, angles=grid, range_min=range_min, range_max=range_max, ignore_error=ignore_error)
+        f = cp.open(resume, fresh)
+        rng_index = cp.rng_index
+        if resume and (collector.keep or as_array):
+            previous = cp.read_completed().decode().replace(os.linesep, "\n")
+        if resume:
+            if isinstance(angles, str):
+                angles = get_positions_from_str(angles)
+            remaining = [pos for pos in angles if not cp.is_done(pos)]
+            if not remaining:
+                logger.warning("All %d positions are already collected in %s, nothing left to collect.",
+                               len(angles), output)
+            angles = remaining
+    else:
+        f = open(output, "w" if fresh else "a") if output else None
+    if sampler:
+        angles = sampler
+    elif planner:
+        angles = planner.plan(angles)
+
+    try:
+        for pos, resp, records in iter_ant_calib_for_angles(angles, range_min, range_max, ignore_error, interval,
+                                                            parse=as_array or sampler is not None,
+                                                            rng_index=rng_index,
+                                                            on_rng_index=cp.lock_rng_index if cp else None,
+                                                            testbench=testbench):
+            if cp:
+                # same bytes as writing in text mode.
+                data = resp.replace("\n", os.linesep).encode()
+                with timing.span("file.write"):
+                    f.write(data)
+                    f.flush()
+                cp.add(pos, data)
+            elif f:
+                with timing.span("file.write"):
                     f.write(resp)
                     f.flush()
-            text += resp
-    logger.debug("data: \n%s", text)
-    return text
+            if sampler:
+                sampler.add(pos, records, ANT_CALIB_METRIC)
+            collector.add(pos, resp, _label(angles, pos))
+            if as_array and records is not None:
+                arrays.append((_label(angles, pos), records))
+    finally:
+        if f:
+            f.close()
+        if cp:
+            cp.close()
 
+    if as_array:
+        if planner:
+            arrays.sort(key=lambda item: item[0])
+        arrays = [records for _, records in arrays]
+        if previous:
+            arrays.insert(0, parse_ant_calib_text(previous))
+        return concat_ant_calib(arrays)
+    text = collector.result()
+    if text is None:
+        return previous or None
+    return previous + text
 
-def collect_akbk_for_one_emulated_target(rcs, rng, vel, ang, nframe, output=None):
-    context = current_context()
-    testbench: TestBench = context.testbench
-    target = testbench.simulators.acquire_target()
-    target.set_rcs(rcs)
-    target.set_range(rng)
-    target.set_speed(vel)
-    target.set_angle(ang)
-    frames = testbench.dut.scan(nframe)
+
+def collect_ant_calib_until_converged(angles, axis="h", range_min=None, range_max=None, interval=None, output=None,
+                                      fit: StreamingDirectionFit = None, testbench: TestBench = None):
+    """
+    Collect ant_calib of one sweep direction and update the calibration estimate after every position, stop as
+    soon as it converged or diverged. Return (collected text, last FitProgress), the calibration itself comes
+    from calibration.run_ant_calib on the collected texts of both directions.
+    """
+    if isinstance(angles, str):
+        angles = get_positions_from_str(angles)
+
+    fit = fit or StreamingDirectionFit(axis)
+    collector = ResultCollector("ant_calib")
+    progress = None
+    f = open(output, "a") if output else None
+    try:
+        for pos, resp, records in iter_ant_calib_for_angles(angles, range_min, range_max, interval=interval,
+                                                            parse=True, testbench=testbench):
+            if f:
+                with timing.span("file.write"):
+                    f.write(resp)
+                    f.flush()
+            collector.add(pos, resp)
+            progress = fit.update(records)
+            logger.debug("%s calibration after X%sY%s: %s positions, delta pos %.4f, delta comp %.3f, residual %.3f",
+                         axis, pos["x"], pos["y"], progress.npos, progress.delta_pos, progress.delta_comp,
+                         progress.residual)
+            if progress.state != COLLECTING:
+                break
+    finally:
+        if f:
+            f.close()
+
+    if progress is not None:
+        logger.info("%s calibration %s after %d of %d positions.", axis, progress.state, progress.npos, len(angles))
+    return collector.result(), progress
+
+
+def collect_akbk_for_one_emulated_target(rcs, rng, vel, ang, nframe, output=None, fmt="txt",
+                                         testbench: TestBench = None):
+    testbench = testbench or current_context().testbench
+    # pooled target keeps applied state, only parameters changed since last iteration are sent.
+    target = testbench.target_pool.acquire()
+    try:
+        target.apply(rcs=rcs, rng=rng, vel=vel, ang=ang)
+        # the target is emulated while scanning, keep it out of the pool until then.
+        frames = testbench.dut.scan(nframe)
+    finally:
+        testbench.target_pool.release(target)
 
     if output:
         os.makedirs(os.path.dirname(output), exist_ok=True)
 
         filename = os.path.join(output.format(rcs=rcs, rng=rng, vel=vel, ang=ang))
-        with open(filename, "w") as f:
-            f.write(frames.raw)
+        if fmt == "bin":
+            filename = os.path.splitext(filename)[0] + capture.EXTENSION
+            capture.write_capture(filename, frames, target=dict(rcs=rcs, rng=rng, vel=vel, ang=ang),
+                                  sensor_cfg=testbench.sensor_cfg)
+        else:
+            write_file(filename, frames.raw)
     return frames
 
 
+def _collect_akbk_shard(testbench, positions, nframe, interval=None, output_dir=None):
+    outputs = []
+    for pos, frames in iter_akbk_for_angles(positions, nframe, interval, testbench=testbench):
+        output = os.path.join(output_dir, "X{}Y{}.txt".format(pos["x"], pos["y"]))
+        write_file(output, frames.raw)
+        outputs.append(output)
+    return outputs
+
+
+def _group_benches(testbench: TestBench = None, group: str = None, group_benches: List[dict] = None) -> list:
+    """
+    Benches of the group of testbench. group_benches are arguments of other benches of the group, they are
+    created with the class of testbench when not created yet. Without group, only testbench is used.
+    """
+    testbench = testbench or current_context().testbench
+    group = group or group_of(testbench)
+    if not group:
+        return [testbench]
+    # the group registry only holds weak references, the returned list keeps created benches alive.
+    benches = {bench.name: bench for bench in benches_in_group(group)}
+    for kwargs in group_benches or []:
+        if kwargs["name"] not in benches:
+            benches[kwargs["name"]] = type(testbench)(group=group, **kwargs)
+    benches = [benches[name] for name in sorted(benches)]
+    logger.info("Group %s: %s.", group, ", ".join(bench.name for bench in benches))
+    return benches
+
+
+def collect_akbk_for_angles_sharded(angles, nframe, output_dir, interval=None, chunk_size=8, group=None,
+                                    group_benches: List[dict] = None, testbench: TestBench = None):
+    """
+    Split the angle grid across benches of the group, every bench has its own turntable and dut. Benches not
+    started by the runner are started for the sweep. A dataset.json in output_dir maps every position to its
+    file and the bench which collected it.
+    """
+    if isinstance(angles, str):
+        angles = get_positions_from_str(angles)
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run_shard(bench, positions):
+        return _collect_akbk_shard(bench, positions, nframe, interval, output_dir)
+
+    with started(_group_benches(testbench, group, group_benches)) as benches:
+        records = ShardedSweep(benches, run_shard, chunk_size=chunk_size).run(angles)
+    save_dataset(records, os.path.join(output_dir, "dataset.json"))
+    return records
+
+
+def collect_akbk_for_emulated_targets_sharded(rcs, iterations, nframe, output, chunk_size=4, ordered=True, group=None,
+                                              group_benches: List[dict] = None, testbench: TestBench = None):
+    """
+    Run every combination of `iterations` ({rng: [], vel: [], ang: []}) across benches of the group, like
+    collect_data.yml. With ordered, consecutive iterations differ in one parameter to reduce simulator commands.
+    """
+    def run_shard(bench, params):
+        for p in params:
+            collect_akbk_for_one_emulated_target(rcs, nframe=nframe, output=output, testbench=bench, **p)
+        return [output.format(rcs=rcs, **p) for p in params]
+
+    params_list = order_iterations(iterations) if ordered else expand_iterations(iterations)
+    logger.info("simulator commands for iterations: %d in grid order, %d in %s order.",
+                count_target_commands(expand_iterations(iterations)), count_target_commands(params_list),
+                "optimized" if ordered else "grid")
+    with started(_group_benches(testbench, group, group_benches)) as benches:
+        records = ShardedSweep(benches, run_shard, chunk_size=chunk_size).run(params_list)
+    save_dataset(records, os.path.join(os.path.dirname(output), "dataset.json"))
+    return records
+
+
 def collect_data_adc():
     raise NotImplementedError
@@ -0,0 +1,84 @@
+# coding: utf-8
+
+import time
+import functools
+import threading
+from typing import Callable, Dict, Union
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, TimeoutError
+
+import logging
+logger = logging.getLogger(__name__)
+
+DeviceResult = namedtuple("DeviceResult", ["name", "result", "error", "elapsed"])
+TimeoutType = Union[None, float, Dict[str, float]]
+
+
+class FanOutError(Exception):
+    def __init__(self, results: Dict[str, DeviceResult]):
+        self.results = results
+        self.errors = OrderedDict((name, r.error) for name, r in results.items() if r.error is not None)
+        super().__init__("; ".join("{}: {!r}".format(name, error) for name, error in self.errors.items()))
+
+
+def _timed(func):
+    start = time.perf_counter()
+    try:
+        return func(), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def _start(name, func) -> Future:
+    """Run func on a daemon thread, so a device hung past its timeout doesn't block interpreter exit."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_timed(func))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name="FanOut-{}".format(name), daemon=True).start()
+    return future
+
+
+def fan_out(calls: Dict[str, Callable], timeout: TimeoutType = None, raise_error: bool = True,
+            title: str = "fan out") -> Dict[str, DeviceResult]:
+    """
+    Run independent device operations concurrently, one thread per device, and collect result, error and
+    elapsed time per device. timeout can be one value for all devices or a dict keyed by device name,
+    a device timed out is reported with TimeoutError while its thread is left to finish in background.
+    """
+    results = OrderedDict()
+    if not calls:
+        return results
+
+    start = time.perf_counter()
+    futures = OrderedDict((name, _start(name, func)) for name, func in calls.items())
+    for name, future in futures.items():
+        device_timeout = timeout.get(name) if isinstance(timeout, dict) else timeout
+        remaining = None if device_timeout is None else max(0.0, device_timeout - (time.perf_counter() - start))
+        try:
+            result, error, elapsed = future.result(remaining)
+        except TimeoutError:
+            result, error, elapsed = None, TimeoutError("{} timed out after {}s".format(name, device_timeout)), \
+                                     time.perf_counter() - start
+        results[name] = DeviceResult(name, result, error, elapsed)
+
+    logger.info("%s: %d devices in %.3fs", title, len(results), time.perf_counter() - start)
+    for r in results.values():
+        logger.info("  %-16s %8.3fs %s", r.name, r.elapsed, "OK" if r.error is None else repr(r.error))
+
+    if raise_error and any(r.error is not None for r in results.values()):
+        raise FanOutError(results)
+    return results
+
+
+def fan_out_each(devices: Dict[str, object], func: Callable, timeout: TimeoutType = None,
+                 title: str = "fan out") -> Dict[str, object]:
+    """Call func(device) for every device concurrently, return results by device name. One device is called inline."""
+    if len(devices) == 1:
+        name, device = next(iter(devices.items()))
+        return OrderedDict([(name, func(device))])
+    calls = OrderedDict((name, functools.partial(func, device)) for name, device in devices.items())
+    return OrderedDict((name, r.result) for name, r in fan_out(calls, timeout=timeout, title=title).items())
@@ -0,0 +1,350 @@
+# coding: utf-8
+
+import re
+import time
+import functools
+import threading
+from collections import namedtuple
+from typing import List
+
+import logging
+logger = logging.getLogger(__name__)
+
+SENSOR_CFG_DUMP_COMMAND = "sensor_cfg_show"
+SENSOR_CFG_LINE = re.compile(r"^[ \t]*(\w+)[ \t]*[:=][ \t]*(.+?)[ \t]*$", re.M)
+
+# commands which change sensor cfg, and adapter methods after which nothing cached can be trusted.
+SENSOR_CFG_WRITE = re.compile(r"^\s*(sensor_cfg\w*\s+\S|bb_init\b|bb_switch\b)")
+RESET_METHODS = ("open", "try_open", "close", "reconnect", "reflash", "flash", "program", "reset")
+SENSOR_CFG_WRITE_METHODS = ("set_sensor_cfg",)
+
+# response lines telling a command failed, "unlocked" of radio commands is a result, not an error.
+COMMAND_ERROR = re.compile(r"\b(error|invalid|unknown command|not supported|fail(ed|ure)?)\b", re.I)
+
+# shell prompt which may precede an echoed command, e.g. 'alps> ' or 'root@alps:/# '.
+PROMPT = re.compile(r"[\w.@:/~\\-]*[>#$%]\s*")
+
+# attributes where an adapter may keep its pyserial port, batches are streamed on it when found.
+SERIAL_PORT_ATTRIBUTES = ("serial", "_serial", "ser", "_ser", "port")
+COMMAND_EOL = "\r\n"
+STREAM_TIMEOUT = 10.0
+# quiet time after the last echo taken as end of output, for shells printing no prompt.
+STREAM_IDLE = 0.2
+
+CommandResult = namedtuple("CommandResult", ["index", "command", "response", "error"])
+
+
+class DeviceCommandError(Exception):
+    def __init__(self, results: List[CommandResult]):
+        self.results = results
+        self.errors = [r for r in results if r.error]
+        super().__init__("; ".join("#{} '{}': {}".format(r.index, r.command, r.error) for r in self.errors))
+
+
+def find_command_error(response: str):
+    """Return the line of response telling the command failed, the echoed command line is skipped."""
+    body = response.strip().partition("\n")[2] if "\n" in response.strip() else response
+    match = COMMAND_ERROR.search(body)
+    if match:
+        start = body.rfind("\n", 0, match.start()) + 1
+        end = body.find("\n", match.end())
+        return body[start:end if end >= 0 else None].strip()
+    return None
+
+
+def _is_echo(line: str, cmd: str) -> bool:
+    line = line.strip()
+    return line == cmd or (line.endswith(cmd) and PROMPT.fullmatch(line[:-len(cmd)]) is not None)
+
+
+def split_responses(stream: str, commands: List[str]) -> List[str]:
+    """Split output of commands sent back to back at their echoed command lines, in order."""
+    responses = []
+    lines = stream.split("\n")
+    starts = []
+    i = 0
+    for cmd in commands:
+        cmd = cmd.strip()
+        while i < len(lines) and not _is_echo(lines[i], cmd):
+            i += 1
+        if i == len(lines):
+            raise ValueError("Echo of '{}' not found in batch response.".format(cmd))
+        starts.append(i)
+        i += 1
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        responses.append("\n".join(lines[start:end]))
+    return responses
+
+
+def find_serial_port(dut):
+    """pyserial port of dut adapter, None if it doesn't expose one."""
+    for name in SERIAL_PORT_ATTRIBUTES:
+        port = getattr(dut, name, None)
+        if port is not None and all(hasattr(port, attr) for attr in ("write", "read", "in_waiting", "timeout")):
+            return port
+    return None
+
+
+def stream_commands(port, commands: List[str], timeout=None, idle: float = STREAM_IDLE) -> str:
+    """
+    Write commands back to back on a serial port, then read until every command is echoed and the output after
+    the last echo ends with a prompt or stays quiet for idle seconds. Return output with '\n' line ends.
+    """
+    timeout = timeout or STREAM_TIMEOUT
+    commands = [cmd.strip() for cmd in commands]
+    saved_timeout = port.timeout
+    port.timeout = min(idle, timeout)
+    try:
+        if hasattr(port, "reset_input_buffer"):
+            port.reset_input_buffer()
+        port.write("".join(cmd + COMMAND_EOL for cmd in commands).encode())
+
+        data = b""
+        deadline = time.monotonic() + timeout
+        nechoed = 0
+        nscanned = 0
+        while True:
+            chunk = port.read(port.in_waiting or 1)
+            data += chunk
+            text = data.decode(errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+            lines = text.split("\n")
+            # only complete lines are matched with echoes, the last one may still be growing.
+            for line in lines[nscanned:-1]:
+                if nechoed < len(commands) and _is_echo(line, commands[nechoed]):
+                    nechoed += 1
+            nscanned = len(lines) - 1
+            if nechoed == len(commands) and (not chunk or PROMPT.fullmatch(lines[-1]) is not None):
+                return text
+            if time.monotonic() > deadline:
+                raise TimeoutError("Only {} of {} commands echoed in {}s: {!r}".format(
+                    nechoed, len(commands), timeout, text[-200:]))
+    finally:
+        port.timeout = saved_timeout
+
+
+def _to_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_sensor_cfg_value(text: str):
+    """Value of one dumped field: a number, a list of numbers for several, otherwise text unchanged."""
+    values = [_to_value(token) for token in text.split()]
+    if not values or any(isinstance(value, str) for value in values):
+        return text
+    return values[0] if len(values) == 1 else values
+
+
+def _shape(text: str) -> str:
+    return "multi" if len(text.split()) > 1 else "single"
+
+
+class CachedDeviceAdapter:
+    """
+    Memoize reads on alps.DeviceAdapter: whole sensor cfg is fetched by one bulk dump and chip identity is read
+    once. Entries are dropped when a command known to change them is sent, or the device is reopened/reflashed.
+
+    Dumped values must read the same as dut.get_sensor_cfg: the first one-value and several-value field
+    served from the dump are compared with a single query, a shape that differs is always queried one by one,
+    same as fields missing in the dump or a dump failed. dump_command=None disables the dump.
+    """
+    def __init__(self, dut, dump_command: str = SENSOR_CFG_DUMP_COMMAND, parse_value=parse_sensor_cfg_value):
+        self._dut = dut
+        self.dump_command = dump_command
+        self.parse_value = parse_value
+        self.hits = 0
+        self.misses = 0
+        self._sensor_cfg = None
+        self._dumped = {}
+        self._trusted = {}
+        self._identity = {}
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._dut, name)
+        if not callable(attr) or name not in RESET_METHODS + SENSOR_CFG_WRITE_METHODS:
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.invalidate(identity=name in RESET_METHODS)
+        return wrapper
+
+    def __repr__(self):
+        return "<{}({!r})>".format(self.__class__.__name__, self._dut)
+
+    @property
+    def adapter(self):
+        return self._dut
+
+    def invalidate(self, identity: bool = True):
+        with self._lock:
+            self._sensor_cfg = None
+            self._dumped = {}
+            if identity:
+                self._identity.clear()
+                self._trusted.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+    def command(self, cmd, *args, **kwargs):
+        try:
+            return self._dut.command(cmd, *args, **kwargs)
+        finally:
+            if SENSOR_CFG_WRITE.match(cmd):
+                self.invalidate(identity=False)
+
+    def batch(self, raise_error: bool = False, timeout=None) -> 'CommandBatch':
+        return CommandBatch(self, raise_error, timeout)
+
+    def command_batch(self, commands: List[str], raise_error: bool = False, timeout=None) -> List[str]:
+        batch = self.batch(raise_error, timeout)
+        for cmd in commands:
+            batch.add(cmd)
+        return batch.send()
+
+    def send_batch(self, commands: List[str], timeout=None) -> List[str]:
+        try:
+            stream = getattr(self._dut, "command_stream", None)
+            if stream is None:
+                port = find_serial_port(self._dut)
+                stream = functools.partial(stream_commands, port) if port is not None else None
+            if stream is None:
+                return [self._dut.command(cmd, timeout=timeout) if timeout else self._dut.command(cmd)
+                        for cmd in commands]
+            with self._lock:
+                return split_responses(stream(commands, timeout=timeout), commands)
+        finally:
+            if any(SENSOR_CFG_WRITE.match(cmd) for cmd in commands):
+                self.invalidate(identity=False)
+
+    def _dump_sensor_cfg(self) -> dict:
+        """Raw text of every field in the dump, empty when there is no usable dump."""
+        if not self.dump_command:
+            return {}
+        try:
+            resp = self._dut.command(self.dump_command)
+        except Exception as e:
+            logger.warning("Dump sensor cfg by '%s' failed: %s", self.dump_command, e)
+            return {}
+        error = find_command_error(resp)
+        body = resp.strip().partition("\n")[2]
+        fields = dict(SENSOR_CFG_LINE.findall(body)) if error is None else {}
+        if not fields:
+            logger.warning("Dump sensor cfg by '%s' isn't usable, query fields one by one: %s",
+                           self.dump_command, error or resp.strip()[:80])
+        return fields
+
+    def _query_sensor_cfg(self, name):
+        self.misses += 1
+        return self._dut.get_sensor_cfg(name)
+
+    def _read_sensor_cfg(self, name):
+        text = self._dumped.get(name)
+        shape = _shape(text) if text is not None else None
+        if text is None or self._trusted.get(shape) is False:
+            return self._query_sensor_cfg(name)
+
+        value = self.parse_value(text)
+        if shape in self._trusted:
+            self.hits += 1
+            return value
+        queried = self._query_sensor_cfg(name)
+        self._trusted[shape] = queried == value
+        if not self._trusted[shape]:
+            logger.warning("Dumped sensor cfg %s reads %r, not %r as queried, query %s value fields one by one.",
+                           name, value, queried, shape)
+        return queried
+
+    def get_sensor_cfg(self, name=None):
+        with self._lock:
+            if self._sensor_cfg is None:
+                self.misses += 1
+                self._sensor_cfg = {}
+                self._dumped = self._dump_sensor_cfg()
+
+            if name is None:
+                return {key: self.get_sensor_cfg(key) for key in list(self._dumped) + list(self._sensor_cfg)}
+            if name in self._sensor_cfg:
+                self.hits += 1
+            else:
+                self._sensor_cfg[name] = self._read_sensor_cfg(name)
+            return self._sensor_cfg[name]
+
+    def _get_identity(self, name):
+        with self._lock:
+            if name in self._identity:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._identity[name] = getattr(self._dut, name)
+            return self._identity[name]
+
+    @property
+    def chip_name(self):
+        return self._get_identity("chip_name")
+
+    @property
+    def chip_rev(self):
+        return self._get_identity("chip_rev")
+
+
+class CommandBatch:
+    """
+    Queue dut commands and send them back to back, responses are split out in order and checked one by one.
+    Adapters having command_stream(commands, timeout) write all commands before reading, so do adapters
+    exposing their pyserial port (see stream_commands), others get them one by one. Sent when leaving the with
+    block without exception. Responses looking like an error are logged, and only raised as DeviceCommandError
+    with raise_error.
+
+        with dut.batch() as batch:
+            batch.add('radio_tx on 0')
+            batch.add('radio_txphase 0 90')
+        batch.responses
+    """
+    def __init__(self, dut: CachedDeviceAdapter, raise_error: bool = False, timeout=None):
+        self.dut = dut
+        self.raise_error = raise_error
+        self.timeout = timeout
+        self.commands = []
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self.commands:
+            self.send()
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, cmd: str) -> int:
+        """Queue cmd, return index of its response."""
+        self.commands.append(cmd)
+        return len(self.commands) - 1
+
+    @property
+    def responses(self) -> List[str]:
+        return [r.response for r in self.results]
+
+    def send(self) -> List[str]:
+        commands, self.commands = self.commands, []
+        responses = self.dut.send_batch(commands, self.timeout)
+        self.results = [CommandResult(i, cmd, resp, find_command_error(resp))
+                        for i, (cmd, resp) in enumerate(zip(commands, responses))]
+        errors = [r for r in self.results if r.error]
+        if errors:
+            logger.warning("%d of %d batched commands failed: %s", len(errors), len(commands),
+                           ", ".join("'{}'".format(r.command) for r in errors))
+            if self.raise_error:
+                raise DeviceCommandError(self.results)
+        return self.responses
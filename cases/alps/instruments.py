@@ -0,0 +1,135 @@
+# coding: utf-8
+
+import functools
+
+import logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_RESET_COMMANDS = ("*RST", ":SYST:PRES", ":SYSTEM:PRESET")
+
+
+class CachedAnalyzer:
+    """
+    Remember settings applied to analyzer created by AnalyzerFactory, commands whose value does not change
+    are skipped. Preset only happens on first use or after an error.
+    """
+    def __init__(self, analyzer):
+        self._analyzer = analyzer
+        self._state = {}
+        self._is_preset = False
+        self.sent = 0
+        self.skipped = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._analyzer, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                self.invalidate()
+                raise
+        return wrapper
+
+    def __repr__(self):
+        return "<{}({!r})>".format(self.__class__.__name__, self._analyzer)
+
+    @property
+    def adapter(self):
+        return self._analyzer
+
+    def _apply(self, key, value, func, *args, **kwargs):
+        if self._state.get(key, _MISSING) == value:
+            self.skipped += 1
+            return None
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.invalidate()
+            raise
+        self._state[key] = value
+        self.sent += 1
+        return result
+
+    def open(self):
+        self.invalidate()
+        self.sent = 0
+        self.skipped = 0
+        return self._analyzer.open()
+
+    def close(self):
+        logger.info("analyzer commands: %d sent, %d skipped.", self.sent, self.skipped)
+        return self._analyzer.close()
+
+    def preset(self):
+        if self._is_preset:
+            self.skipped += 1
+            return
+
+        self._state.clear()
+        try:
+            self._analyzer.preset()
+        except Exception:
+            self.invalidate()
+            raise
+        self._is_preset = True
+        self.sent += 1
+
+    def invalidate(self):
+        self._state.clear()
+        self._is_preset = False
+
+    def resync(self):
+        self.invalidate()
+        self.preset()
+
+    def verify(self) -> bool:
+        """
+        Query cached SCPI settings back from instrument with command('<header>?'), resync when any of them
+        mismatches. Call it after settings are applied, right after open or preset there is nothing to check.
+        """
+        for header, value in list(self._state.items()):
+            if not isinstance(header, str) or not header.startswith(":"):
+                continue
+            actual = self._analyzer.command("{}?".format(header))
+            if not isinstance(actual, str):
+                logger.warning("analyzer doesn't answer %s?, can't verify cached settings.", header)
+                return True
+            actual = actual.strip()
+            try:
+                is_same = float(actual) == float(value)
+            except ValueError:
+                is_same = actual.upper() == value.upper()
+            if not is_same:
+                logger.warning("analyzer %s is %s, expect %s, resync.", header, actual, value)
+                self.resync()
+                return False
+        return True
+
+    def mixer_signal_id(self, *args, **kwargs):
+        return self._apply("mixer_signal_id", (args, kwargs), self._analyzer.mixer_signal_id, *args, **kwargs)
+
+    def trace(self, mode):
+        return self._apply("trace", mode.upper(), self._analyzer.trace, mode)
+
+    def peak_table(self, *args, **kwargs):
+        return self._apply("peak_table", (args, kwargs), self._analyzer.peak_table, *args, **kwargs)
+
+    def frequency(self, start, stop):
+        return self._apply("frequency", (start, stop), self._analyzer.frequency, start, stop)
+
+    def command(self, cmd, *args, **kwargs):
+        header, _, value = cmd.strip().partition(" ")
+        if header.upper() in _RESET_COMMANDS:
+            self.invalidate()
+        if not value or header.endswith("?"):
+            return self._analyzer.command(cmd, *args, **kwargs)
+        return self._apply(header.upper(), value.strip(), self._analyzer.command, cmd, *args, **kwargs)
+
+    def stats(self):
+        return dict(sent=self.sent, skipped=self.skipped)
@@ -0,0 +1,216 @@
+# coding: utf-8
+
+"""
+Plan the order turntable positions are visited, between the position list and rot.goto.
+
+Grids written as 'H@-60:60:2*V@-50:50:2' are generated lazily and visited in serpentine order, the inner
+axis is the one giving the shorter estimated travel. Other position lists are visited nearest neighbour first.
+Every position keeps its label, the index in raster order (H changes fastest), so results can be put back.
+"""
+
+import re
+import time
+import itertools
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Union
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+AXIS_KEYS = {"H": "x", "V": "y"}
+GRID_FACTOR = re.compile(r"^\s*([HV])@(-?\d+(?:\.\d+)?):(-?\d+(?:\.\d+)?):(\d+(?:\.\d+)?)\s*$")
+
+SERPENTINE = "serpentine"
+NEAREST = "nearest"
+RASTER = "raster"
+
+
+class AxisRange:
+    """Inclusive start:stop:step values of one axis, without expanding them."""
+    def __init__(self, start: float, stop: float, step: float):
+        self.start = start
+        self.step = step
+        self.count = int(np.floor((stop - start) / step + 1e-9)) + 1 if step else 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return round(self.start + i * self.step, 9)
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def index(self, value) -> int:
+        return int(round((value - self.start) / self.step)) if self.step else 0
+
+    @property
+    def span(self):
+        return (self.count - 1) * self.step
+
+
+def parse_grid(spec: str) -> Union[None, 'OrderedDict[str, AxisRange]']:
+    """Return axis ranges of a grid spec, or None when spec isn't a plain grid."""
+    grid = OrderedDict()
+    for factor in spec.split("*"):
+        match = GRID_FACTOR.match(factor)
+        if not match or AXIS_KEYS[match.group(1)] in grid:
+            return None
+        start, stop, step = (float(v) for v in match.groups()[1:])
+        grid[AXIS_KEYS[match.group(1)]] = AxisRange(start, stop, step)
+    return grid
+
+
+class MotionModel:
+    """Both axes move together, a move takes the slower axis' travel at its speed (degree/s), plus settle."""
+    def __init__(self, speed: Union[float, Dict[str, float]] = 30.0, settle: float = 0.0):
+        if not isinstance(speed, dict):
+            speed = dict(x=speed, y=speed)
+        self.speed = speed
+        self.settle = settle
+
+    def travel(self, a: dict, b: dict) -> float:
+        elapsed = max(abs(b.get(k, 0) - a.get(k, 0)) / self.speed[k] for k in ("x", "y"))
+        return elapsed + self.settle if elapsed else 0.0
+
+    def estimate(self, positions: Iterable[dict], start: dict = None) -> float:
+        total = 0.0
+        last = start or dict(x=0, y=0)
+        for pos in positions:
+            total += self.travel(last, pos)
+            last = pos
+        return total
+
+
+def _raster(grid) -> Iterator[dict]:
+    keys = list(grid)
+    defaults = {k: 0 for k in ("x", "y") if k not in grid}
+    for values in itertools.product(*(grid[k] for k in reversed(keys))):
+        yield dict(defaults, **dict(zip(reversed(keys), values)))
+
+
+def _serpentine(grid, inner: str) -> Iterator[dict]:
+    outer = [k for k in grid if k != inner]
+    defaults = {k: 0 for k in ("x", "y") if k not in grid}
+    rows = grid[outer[0]] if outer else [None]
+    for i, value in enumerate(rows):
+        cells = grid[inner] if i % 2 == 0 else (grid[inner][j] for j in reversed(range(len(grid[inner]))))
+        for cell in cells:
+            pos = dict(defaults)
+            pos[inner] = cell
+            if outer:
+                pos[outer[0]] = value
+            yield pos
+
+
+def order_nearest(positions: list, start: dict) -> Iterator[dict]:
+    points = np.array([(pos.get("x", 0), pos.get("y", 0)) for pos in positions], dtype=float)
+    visited = np.zeros(len(points), dtype=bool)
+    current = np.array([start.get("x", 0), start.get("y", 0)], dtype=float)
+    for _ in range(len(points)):
+        distance = np.abs(points - current).max(axis=1)
+        distance[visited] = np.inf
+        i = int(distance.argmin())
+        visited[i] = True
+        current = points[i]
+        yield positions[i]
+
+
+class Plan:
+    """Lazy stream of positions in planned order, moves done through it are timed for the report."""
+    def __init__(self, planned: Callable[[], Iterator[dict]], raster: Callable[[], Iterator[dict]],
+                 label: Callable[[dict], int], model: MotionModel, start: dict, strategy: str):
+        self._planned = planned
+        self._raster = raster
+        self._label = label
+        self.model = model
+        self.start = start
+        self.strategy = strategy
+        self.moves = 0
+        self.measured = 0.0
+        self._estimates = None
+
+    def __iter__(self):
+        yield from self._planned()
+        self.report()
+
+    def label(self, pos: dict) -> int:
+        return self._label(pos)
+
+    def move(self, rot, pos: dict):
+        start = time.perf_counter()
+        rot.goto(**pos)
+        self.measured += time.perf_counter() - start
+        self.moves += 1
+
+    def estimate(self):
+        """Estimated travel time of (raster order, planned order)."""
+        if self._estimates is None:
+            self._estimates = (self.model.estimate(self._raster(), self.start),
+                               self.model.estimate(self._planned(), self.start))
+        return self._estimates
+
+    def report(self):
+        raster, planned = self.estimate()
+        logger.info("%s order: estimated travel %.1fs, raster %.1fs, saved %.1fs.",
+                    self.strategy, planned, raster, raster - planned)
+        if self.moves and planned:
+            # scale raster estimate by how far measured travel is off the planned estimate.
+            logger.info("%d moves took %.1fs, saved about %.1fs against raster order.",
+                        self.moves, self.measured, raster * self.measured / planned - self.measured)
+
+
+class MotionPlanner:
+    def __init__(self, strategy: str = SERPENTINE, speed: Union[float, Dict[str, float]] = 30.0,
+                 settle: float = 0.0, start: dict = None):
+        if strategy not in (SERPENTINE, NEAREST, RASTER):
+            raise ValueError("Unknown motion strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.model = MotionModel(speed, settle)
+        self.start = start or dict(x=0, y=0)
+
+    def plan(self, angles: Union[str, Iterable[dict]]) -> Plan:
+        grid = parse_grid(angles) if isinstance(angles, str) else None
+        if grid is not None and self.strategy != NEAREST:
+            return self._plan_grid(grid)
+
+        if isinstance(angles, str):
+            from calterah.util import get_positions_from_str
+            angles = get_positions_from_str(angles)
+        positions = list(angles)
+        labels = {}
+        for i, pos in enumerate(positions):
+            labels.setdefault((pos.get("x", 0), pos.get("y", 0)), i)
+
+        def label(pos):
+            return labels[(pos.get("x", 0), pos.get("y", 0))]
+
+        def planned():
+            if self.strategy == RASTER:
+                return iter(positions)
+            return order_nearest(positions, self.start)
+        return Plan(planned, lambda: iter(positions), label, self.model, self.start,
+                    RASTER if self.strategy == RASTER else NEAREST)
+
+    def _plan_grid(self, grid) -> Plan:
+        keys = list(grid)
+
+        def label(pos):
+            index = 0
+            for k in reversed(keys):
+                index = index * len(grid[k]) + grid[k].index(pos[k])
+            return index
+
+        def raster():
+            return _raster(grid)
+
+        if self.strategy == RASTER:
+            return Plan(raster, raster, label, self.model, self.start, RASTER)
+
+        candidates = [lambda inner=inner: _serpentine(grid, inner) for inner in keys]
+        best = min(candidates, key=lambda planned: self.model.estimate(planned(), self.start))
+        return Plan(best, raster, label, self.model, self.start, SERPENTINE)
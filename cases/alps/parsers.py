@@ -0,0 +1,152 @@
+# coding: utf-8
+
+import re
+import functools
+import numpy as np
+
+ANT_CALIB_LINE = re.compile(r"^[^\n]*?rng_index[ \t]+(\d+)[^\n]*?\brange[ \t]+(-?\d+(?:\.\d+)?)([^\n]*)$", re.M)
+ANT_CALIB_ECHO = "ant_calib"
+ANT_CALIB_ECHO_POS = re.compile(r"^ant_calib[ \t]+X(-?\d+(?:\.\d+)?)Y(-?\d+(?:\.\d+)?)[^\n]*$", re.M)
+FLOAT = re.compile(r"-?\d+\.\d+")
+RNG_INDEX = re.compile(r"rng_index (\d+)")
+NO_RANGE = re.compile(r"range 0\.00")
+
+
+@functools.lru_cache()
+def ant_calib_dtype(nchannel: int) -> np.dtype:
+    return np.dtype([("x", "<f8"), ("y", "<f8"), ("rng_index", "<i4"), ("range", "<f8"),
+                     ("values", "<f8", (nchannel,))])
+
+
+def _raise_malformed(body):
+    for line in body.split("\n"):
+        if line.strip() and not ANT_CALIB_LINE.search(line):
+            raise ValueError("Malformed ant_calib line: {!r}".format(line.strip()))
+
+
+def _fill_records(rows, values, pos):
+    nchannel = max(map(len, values), default=0)
+    records = np.empty(len(rows), dtype=ant_calib_dtype(nchannel))
+    records["x"] = pos["x"] if pos else np.nan
+    records["y"] = pos["y"] if pos else np.nan
+    records["rng_index"] = [rng_index for rng_index, _, _ in rows]
+    records["range"] = [rng for _, rng, _ in rows]
+    if all(len(v) == nchannel for v in values):
+        records["values"] = np.array(values, dtype=float).reshape(len(rows), nchannel)
+    else:
+        records["values"] = np.nan
+        for i, v in enumerate(values):
+            records["values"][i, :len(v)] = v
+    return records
+
+
+def _to_records(rows, pos=None):
+    try:
+        return _fill_records(rows, [rest.split() for _, _, rest in rows], pos)
+    except ValueError:
+        # same as old extraction, tokens other than decimals (e.g. 'ch0:', trailing commas) are skipped.
+        return _fill_records(rows, [FLOAT.findall(rest) for _, _, rest in rows], pos)
+
+
+def parse_ant_calib(text: str, pos: dict = None) -> np.ndarray:
+    """
+    Parse one ant_calib response into a structured array with one record per line,
+    the first line is the echoed command and is skipped.
+    """
+    body = text.strip().partition("\n")[2]
+    rows = ANT_CALIB_LINE.findall(body)
+    if len(rows) != sum(1 for line in body.split("\n") if line.strip()):
+        _raise_malformed(body)
+    return _to_records(rows, pos)
+
+
+def parse_ant_calib_file(path) -> np.ndarray:
+    """Parse the output file of collect_ant_calib_for_angles, echoed commands are skipped."""
+    with open(path) as f:
+        text = f.read()
+    body = "\n".join(line for line in text.split("\n") if not line.startswith(ANT_CALIB_ECHO))
+    rows = ANT_CALIB_LINE.findall(body)
+    if len(rows) != sum(1 for line in body.split("\n") if line.strip()):
+        _raise_malformed(body)
+    return _to_records(rows)
+
+
+def parse_ant_calib_text(text: str) -> np.ndarray:
+    """
+    Parse text of several ant_calib responses as collected by collect_ant_calib_for_angles,
+    position of every record is taken from the echoed 'ant_calib X..Y..' command before it.
+    """
+    parts = ANT_CALIB_ECHO_POS.split(text)
+    if parts[0].strip():
+        raise ValueError("ant_calib response without echoed 'ant_calib X..Y..' command: {!r}".format(
+            parts[0].strip()[:200]))
+    arrays = []
+    for x, y, body in zip(parts[1::3], parts[2::3], parts[3::3]):
+        rows = ANT_CALIB_LINE.findall(body)
+        if len(rows) != sum(1 for line in body.split("\n") if line.strip()):
+            _raise_malformed(body)
+        arrays.append(_to_records(rows, dict(x=float(x), y=float(y))))
+    return concat_ant_calib(arrays)
+
+
+def parse_float_vector(text: str) -> np.ndarray:
+    """Parse decimal values printed by dut, e.g. response of 'ant_prog pos'."""
+    return np.array(FLOAT.findall(text), dtype=float)
+
+
+def parse_ant_prog(text: str, name: str) -> np.ndarray:
+    """Values of the last 'ant_prog <name>' line, e.g. 'ant_prog pos' or 'ant_prog comp' printed by ant_calib."""
+    lines = [line for line in text.split("\n") if "ant_prog {}".format(name) in line]
+    if not lines:
+        raise ValueError("'ant_prog {}' is not found in {!r}".format(name, text[-200:]))
+    return np.array(FLOAT.findall(lines[-1]), dtype=float)
+
+
+def check_ant_calib(text: str, rng_index=None):
+    """
+    Check one ant_calib response while collecting without parsing values, the first line is the echoed
+    command: rng_index should always be same during test, and range should not be 0.00.
+    """
+    body = text.strip().partition("\n")[2]
+    indexes = RNG_INDEX.findall(body)
+    if len(indexes) != sum(1 for line in body.split("\n") if line.strip()):
+        raise AssertionError("rng_index is not found in every line of {!r}".format(body))
+    if indexes:
+        if rng_index is None:
+            rng_index = int(indexes[0])
+        if any(int(index) != int(rng_index) for index in set(indexes)):
+            raise AssertionError("rng_index is not match")
+    if NO_RANGE.search(body):
+        raise AssertionError("range should not be 0.00")
+    return rng_index
+
+
+def check_range_and_index(records: np.ndarray, rng_index=None):
+    """rng_index should always be same during test, and range should not be 0.00."""
+    if len(records) == 0:
+        return rng_index
+    if rng_index is None:
+        rng_index = int(records["rng_index"][0])
+    if (records["rng_index"] != int(rng_index)).any():
+        raise AssertionError("rng_index is not match")
+    if ((records["range"] >= 0) & (records["range"] < 0.01)).any():
+        raise AssertionError("range should not be 0.00")
+    return rng_index
+
+
+def concat_ant_calib(arrays) -> np.ndarray:
+    """Concatenate parsed responses, padding channel values to the widest one."""
+    arrays = list(arrays)
+    if not arrays:
+        return np.zeros(0, dtype=ant_calib_dtype(0))
+    nchannel = max(a["values"].shape[1] for a in arrays)
+    result = np.zeros(sum(len(a) for a in arrays), dtype=ant_calib_dtype(nchannel))
+    result["values"] = np.nan
+    offset = 0
+    for a in arrays:
+        part = result[offset:offset + len(a)]
+        for name in ("x", "y", "rng_index", "range"):
+            part[name] = a[name]
+        part["values"][:, :a["values"].shape[1]] = a["values"]
+        offset += len(a)
+    return result
@@ -0,0 +1,152 @@
+# coding: utf-8
+
+import time
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import timing
+from timing import span
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = OrderedDict()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, elapsed):
+        with self._lock:
+            count, total = self._stages.get(name, (0, 0.0))
+            self._stages[name] = (count + 1, total + elapsed)
+
+    def summary(self):
+        with self._lock:
+            return OrderedDict(
+                (name, dict(count=count, total=total, avg=total / count))
+                for name, (count, total) in self._stages.items()
+            )
+
+    def bottleneck(self):
+        summary = self.summary()
+        if not summary:
+            return None
+        return max(summary, key=lambda name: summary[name]["total"])
+
+    def log(self, title):
+        wall = time.perf_counter() - self._started
+        logger.info("%s: wall %.3fs, bottleneck: %s", title, wall, self.bottleneck())
+        for name, stat in self.summary().items():
+            logger.info("  %-12s count %6d, total %9.3fs, avg %8.4fs",
+                        name, stat["count"], stat["total"], stat["avg"])
+
+
+class BackgroundWriter:
+    """
+    Run file writes (and the encoding done before them) on a worker thread, the bounded queue
+    throttles the producer when the disk can not keep up.
+    """
+    _STOP = object()
+
+    def __init__(self, maxsize: int = 8, timer: StageTimer = None):
+        self.timer = timer or StageTimer()
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="BackgroundWriter", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        self._raise_error()
+        with self.timer.stage("queue_wait"):
+            self._queue.put((func, args, kwargs))
+
+    def write(self, path, data, mode="w"):
+        self.submit(write_file, path, data, mode)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        timing.bind(timing.background)
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            if self._error is not None:
+                continue        # drain remaining jobs after failure, the error is raised to the producer.
+
+            func, args, kwargs = item
+            try:
+                with self.timer.stage("write"):
+                    func(*args, **kwargs)
+            except Exception as e:
+                logger.exception("Background write failed.")
+                self._error = e
+
+
+def write_file(path, data, mode="w"):
+    if callable(data):
+        data = data()
+    with span("file.write"):
+        with open(path, mode) as f:
+            f.write(data)
+
+
+class ResultCollector:
+    """
+    Accumulate per-position results, only sizes and offsets are logged. With keep=False nothing is
+    kept in memory, results only go to the sink, so peak memory doesn't grow with the grid.
+    Results added with a label are returned sorted by it, e.g. raster index of a reordered sweep.
+    """
+    def __init__(self, name: str, keep: bool = True, sink=None):
+        self.name = name
+        self.keep = keep
+        self.sink = sink
+        self.count = 0
+        self.size = 0
+        self._chunks = []
+
+    def add(self, pos, data: str, label=None):
+        logger.debug("%s: X%sY%s offset %d, size %d", self.name, pos["x"], pos["y"], self.size, len(data))
+        if self.sink:
+            self.sink(pos, data)
+        if self.keep:
+            self._chunks.append((label, data) if label is not None else data)
+        self.count += 1
+        self.size += len(data)
+
+    def result(self):
+        logger.debug("%s: %d positions, %d bytes in total.", self.name, self.count, self.size)
+        if not self.keep:
+            return None
+        if self._chunks and isinstance(self._chunks[0], tuple):
+            return "".join(data for _, data in sorted(self._chunks, key=lambda chunk: chunk[0]))
+        return "".join(self._chunks)
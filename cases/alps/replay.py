@@ -0,0 +1,64 @@
+# coding: utf-8
+
+"""
+Benches serving devices from a session recorded with `record_path`, same testcases run offline at CPU speed:
+
+    testbench = ReplayTestBench("replay-tb", "C:\\sessions\\sanity.session.gz", rts_setups=[{}])
+"""
+
+from ngta import TestBench as BaseTestBench
+
+from bench import MeasureTestBench, TestBench
+from device import CachedDeviceAdapter
+from instruments import CachedAnalyzer
+from session import SessionPlayer
+from simulated import SimApp, SimSimulators
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ReplayTestBench(TestBench):
+    def __init__(self, name: str, session_path: str, **kwargs):
+        super().__init__(name, **kwargs)
+        self.session_path = session_path
+        self.player = None
+
+    def _create_devices(self):
+        self.player = SessionPlayer.load(self.session_path)
+        self.simulators = SimSimulators(len(self.rts_setups or []))
+        self.dut = CachedDeviceAdapter(self.player.device("dut"))
+        self.rot = self.player.device("rot") if self.player.has_device("rot") else None
+        self.app = SimApp()
+
+    def on_testrunner_stopped(self, event):
+        super().on_testrunner_stopped(event)
+        logger.info("%s replay: %s", self, self.player.stats())
+
+    def as_dict(self):
+        d = super().as_dict()
+        d['session_path'] = self.session_path
+        return d
+
+    @classmethod
+    def from_dict(cls, d) -> 'ReplayTestBench':
+        return cls(d["name"], d["session_path"], rts_setups=d["rts_setups"], routes=d["routes"],
+                   group=d.get("group"), reorder_by_mode=d.get("reorder_by_mode", False), mode_depends=d.get("mode_depends"),
+                   collect_timing=d.get("collect_timing", d.get("timing", False)), trace_path=d.get("trace_path"))
+
+
+class ReplayMeasureTestBench(MeasureTestBench):
+    def __init__(self, session_path: str):
+        BaseTestBench.__init__(self, "ReplayMeasureTestBench", type='alps', exclusive=True)
+        self.session_path = session_path
+        self.player = player = SessionPlayer.load(session_path)
+        self.dut = CachedDeviceAdapter(player.device("dut"))
+        self.src = CachedDeviceAdapter(player.device("src")) if player.has_device("src") else None
+        self.rot = player.device("rot") if player.has_device("rot") else None
+        self.analyzer = CachedAnalyzer(player.device("analyzer")) if player.has_device("analyzer") else None
+        self.recorder = None
+        self.trace_path = None
+
+    def on_testrunner_stopped(self, event):
+        super().on_testrunner_stopped(event)
+        logger.info("%s replay: %s", self, self.player.stats())
@@ -0,0 +1,59 @@
+# coding: utf-8
+
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import logging
+logger = logging.getLogger(__name__)
+
+GUI_MODE = "gui"
+SERIAL_MODE = "serial"
+GUI_PATH_PREFIX = "alps.gui"
+
+
+def get_bench_mode(testcase) -> str:
+    return GUI_MODE if testcase.path.startswith(GUI_PATH_PREFIX) else SERIAL_MODE
+
+
+def count_switches(modes: Iterable[str], start_mode: str = None) -> int:
+    switches = 0
+    current = start_mode
+    for mode in modes:
+        if current is not None and mode != current:
+            switches += 1
+        current = mode
+    return switches
+
+
+def order_by_bench_mode(testcases: List, depends: Dict[str, Iterable[str]] = None,
+                        key: Callable = get_bench_mode, start_mode: str = None) -> Tuple[List, int, int]:
+    """
+    Reorder testcases so cases requiring same bench mode run together, return (ordered, switches before,
+    switches after). Order is stable inside a mode, and a case never runs before the cases its path depends on,
+    declared by `depends` {path: [paths]} or by a `depends_on` attribute on the testcase.
+    """
+    depends = depends or {}
+    paths = [tc.path for tc in testcases]
+    requires = []
+    for tc in testcases:
+        required = set(depends.get(tc.path, ())) | set(getattr(tc, "depends_on", None) or ())
+        requires.append(required & set(paths))
+
+    remaining = list(range(len(testcases)))
+    pending_paths = list(paths)
+    ordered = []
+    current = start_mode
+    while remaining:
+        ready = [i for i in remaining if not (requires[i] & set(pending_paths) - {paths[i]})]
+        if not ready:
+            raise ValueError("Circular dependency between testcases: {}".format([paths[i] for i in remaining]))
+
+        same_mode = [i for i in ready if key(testcases[i]) == current]
+        index = same_mode[0] if same_mode else ready[0]
+        current = key(testcases[index])
+        ordered.append(testcases[index])
+        remaining.remove(index)
+        pending_paths.remove(paths[index])
+
+    before = count_switches((key(tc) for tc in testcases), start_mode)
+    after = count_switches((key(tc) for tc in ordered), start_mode)
+    return ordered, before, after
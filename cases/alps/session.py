@@ -0,0 +1,207 @@
+# coding: utf-8
+
+"""
+Record every request and response between bench and its devices into a session file, and serve them back
+without hardware or delays, so checking logic and parsers can be rerun on a recorded session at CPU speed.
+
+Session file is a gzip stream of pickled records, the first one is the header:
+    (device, name, args, kwargs, kind, value, elapsed)
+kind is 'return', 'raise' or 'attr' (attribute read, e.g. dut.is_open, dut.chip_name).
+"""
+
+import time
+import gzip
+import pickle
+import threading
+from collections import namedtuple, defaultdict, deque
+
+from device import CachedDeviceAdapter
+from instruments import CachedAnalyzer
+
+import logging
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+SESSION_EXTENSION = ".session.gz"
+RECORD_DEVICES = ("dut", "src", "rot", "analyzer")
+
+SessionRecord = namedtuple("SessionRecord", ["device", "name", "args", "kwargs", "kind", "value", "elapsed"])
+
+
+class ReplayError(Exception):
+    pass
+
+
+class _Unpicklable:
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return "<unpicklable {}>".format(self.text)
+
+
+def _key(name, args, kwargs):
+    return name, repr(args), repr(sorted(kwargs.items()))
+
+
+class SessionRecorder:
+    def __init__(self, path: str, **metadata):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wb", compresslevel=1)
+        pickle.dump(dict(metadata, version=SESSION_VERSION, created=time.time()), self._file)
+
+    def add(self, device, name, args, kwargs, kind, value, elapsed):
+        record = SessionRecord(device, name, args, kwargs, kind, value, elapsed)
+        try:
+            data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning("Can't record %s.%s result %r: %s", device, name, value, e)
+            data = pickle.dumps(record._replace(value=_Unpicklable(repr(value))), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+                self.count += 1
+
+    def proxy(self, device, name):
+        return RecordingProxy(device, name, self)
+
+    def attach(self, bench):
+        """Put recording proxy under cache layers of bench devices, so recorded traffic is what the device sees."""
+        for name in RECORD_DEVICES:
+            device = getattr(bench, name, None)
+            if device is None:
+                continue
+            if isinstance(device, CachedDeviceAdapter):
+                device = CachedDeviceAdapter(self.proxy(device.adapter, name), device.dump_command, device.parse_value)
+            elif isinstance(device, CachedAnalyzer):
+                device = CachedAnalyzer(self.proxy(device.adapter, name))
+            else:
+                device = self.proxy(device, name)
+            setattr(bench, name, device)
+        logger.info("Record %s session to %s", bench, self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info("Recorded %d device calls to %s", self.count, self.path)
+
+
+class RecordingProxy:
+    def __init__(self, device, name: str, recorder: SessionRecorder):
+        self._device = device
+        self._name = name
+        self._recorder = recorder
+
+    def __repr__(self):
+        return "<{}({!r})>".format(self.__class__.__name__, self._device)
+
+    def __getattr__(self, name):
+        attr = getattr(self._device, name)
+        if not callable(attr):
+            self._recorder.add(self._name, name, (), {}, "attr", attr, 0.0)
+            return attr
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._recorder.add(self._name, name, args, kwargs, "raise", e, time.perf_counter() - start)
+                raise
+            self._recorder.add(self._name, name, args, kwargs, "return", result, time.perf_counter() - start)
+            return result
+        return wrapper
+
+
+class SessionPlayer:
+    """
+    Serve recorded device calls back. Calls are matched per device by method and arguments, in recorded order,
+    since devices brought up in parallel interleave differently between runs. Once recorded responses of a call
+    are used up the last one is repeated, e.g. for extra analyzer polls when nothing waits for real time.
+    """
+    def __init__(self, header: dict, records):
+        self.header = header
+        self.devices = set()
+        self.names = defaultdict(set)
+        self.served = 0
+        self.repeated = 0
+        self._lock = threading.Lock()
+        self._queues = defaultdict(deque)
+        self._last = {}
+        for record in records:
+            self.devices.add(record.device)
+            self.names[record.device].add(record.name)
+            self._queues[(record.device,) + _key(record.name, record.args, record.kwargs)].append(record)
+
+    @classmethod
+    def load(cls, path: str) -> 'SessionPlayer':
+        records = []
+        with gzip.open(path, "rb") as f:
+            header = pickle.load(f)
+            while True:
+                try:
+                    records.append(pickle.load(f))
+                except EOFError:
+                    break
+        logger.info("Load %d device calls from %s", len(records), path)
+        return cls(header, records)
+
+    def has_device(self, device: str) -> bool:
+        return device in self.devices
+
+    def device(self, device: str) -> 'ReplayDevice':
+        return ReplayDevice(self, device)
+
+    def peek(self, device, name):
+        with self._lock:
+            key = (device,) + _key(name, (), {})
+            queue = self._queues.get(key)
+            record = queue[0] if queue else self._last.get(key)
+        return record is not None and record.kind == "attr"
+
+    def serve(self, device, name, args, kwargs):
+        key = (device,) + _key(name, args, kwargs)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                record = queue.popleft()
+                self._last[key] = record
+                self.served += 1
+            elif key in self._last:
+                record = self._last[key]
+                self.repeated += 1
+            else:
+                raise ReplayError("{}.{}(*{!r}, **{!r}) is not in recorded session.".format(device, name, args, kwargs))
+
+        if isinstance(record.value, _Unpicklable):
+            raise ReplayError("{}.{} result was not recorded: {!r}".format(device, name, record.value))
+        if record.kind == "raise":
+            raise record.value
+        return record.value
+
+    def stats(self):
+        remaining = sum(len(queue) for queue in self._queues.values())
+        return dict(served=self.served, repeated=self.repeated, remaining=remaining)
+
+
+class ReplayDevice:
+    def __init__(self, player: SessionPlayer, name: str):
+        self._player = player
+        self._name = name
+
+    def __repr__(self):
+        return "<{}({})>".format(self.__class__.__name__, self._name)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name not in self._player.names[self._name]:
+            raise AttributeError(name)
+        if self._player.peek(self._name, name):
+            return self._player.serve(self._name, name, (), {})
+
+        def wrapper(*args, **kwargs):
+            return self._player.serve(self._name, name, args, kwargs)
+        return wrapper
@@ -0,0 +1,209 @@
+# coding: utf-8
+
+import json
+import time
+import queue
+import pickle
+import weakref
+import itertools
+import functools
+import threading
+import importlib
+import contextlib
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from concurrency import fan_out
+
+import logging
+logger = logging.getLogger(__name__)
+
+Chunk = namedtuple("Chunk", ["id", "start", "items", "attempt"])
+ShardRecord = namedtuple("ShardRecord", ["index", "item", "result", "provenance"])
+
+
+def expand_iterations(iterations: Dict[str, Iterable]) -> List[dict]:
+    """Expand ngta style iterations {name: values} into list of parameter dicts, last name changes fastest."""
+    names = list(iterations)
+    return [dict(zip(names, values)) for values in itertools.product(*(iterations[name] for name in names))]
+
+
+_groups = OrderedDict()
+
+
+def register_bench(bench, group: str):
+    """Called by benches created with a group, so sharded collection can find the others of its group."""
+    if group:
+        _groups.setdefault(group, weakref.WeakValueDictionary())[bench.name] = bench
+
+
+def group_of(bench) -> Optional[str]:
+    for group, benches in _groups.items():
+        if benches.get(bench.name) is bench:
+            return group
+    return None
+
+
+def benches_in_group(group: str) -> list:
+    """Benches created in this runner with group, in name order."""
+    benches = _groups.get(group, {})
+    return [benches[name] for name in sorted(benches)]
+
+
+@contextlib.contextmanager
+def started(benches: list):
+    """
+    Start benches the runner didn't start, e.g. other benches of the group, and stop them afterwards.
+    A bench failing to start is left out with a warning, the others take its share.
+    """
+    todo = [bench for bench in benches if not bench.is_started]
+    results = fan_out(OrderedDict((bench.name, functools.partial(bench.on_testrunner_started, None))
+                                  for bench in todo), raise_error=False, title="start group benches")
+    failed = {name for name, r in results.items() if r.error is not None}
+    for name in failed:
+        logger.warning("Bench %s failed to start, leave it out: %r", name, results[name].error)
+    try:
+        yield [bench for bench in benches if bench.name not in failed]
+    finally:
+        fan_out(OrderedDict((bench.name, functools.partial(bench.on_testrunner_stopped, None))
+                            for bench in todo if bench.is_started), raise_error=False, title="stop group benches")
+
+
+class ShardError(Exception):
+    pass
+
+
+class ShardedSweep:
+    """
+    Split work items into small chunks and let every bench pull the next chunk when it is free, so benches
+    finishing early take more work. A chunk failed on one bench is given back to the queue for others, a bench
+    failing max_failures times in a row stops pulling.
+
+    run_shard(bench, items) must return one result per item, in order.
+    """
+    def __init__(self, benches: list, run_shard: Callable, chunk_size: int = 8,
+                 max_failures: int = 2, max_attempts: int = 3):
+        if not benches:
+            raise ValueError("No bench to run shards.")
+        self.benches = benches
+        self.run_shard = run_shard
+        self.chunk_size = chunk_size
+        self.max_failures = max_failures
+        self.max_attempts = max_attempts
+
+    def run(self, items: list) -> List[ShardRecord]:
+        items = list(items)
+        chunks = queue.Queue()
+        for i, start in enumerate(range(0, len(items), self.chunk_size)):
+            chunks.put(Chunk(i, start, items[start:start + self.chunk_size], 1))
+
+        records = [None] * len(items)
+        errors = []
+        pending = [len(items)]
+        lock = threading.Lock()
+        done = threading.Event()
+        if not items:
+            done.set()
+
+        def worker(bench):
+            failures = 0
+            while not done.is_set():
+                try:
+                    chunk = chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    results = list(self.run_shard(bench, chunk.items))
+                    if len(results) != len(chunk.items):
+                        raise ShardError("{} results for {} items".format(len(results), len(chunk.items)))
+                except Exception as e:
+                    failures += 1
+                    logger.warning("Chunk %d failed on %s (attempt %d): %r", chunk.id, bench, chunk.attempt, e)
+                    with lock:
+                        if chunk.attempt >= self.max_attempts:
+                            errors.append((chunk, e))
+                            pending[0] -= len(chunk.items)
+                            if pending[0] == 0:
+                                done.set()
+                        else:
+                            chunks.put(chunk._replace(attempt=chunk.attempt + 1))
+                    if failures >= self.max_failures:
+                        logger.error("%s failed %d times in a row, stop using it.", bench, failures)
+                        return
+                    continue
+
+                failures = 0
+                provenance = dict(bench=getattr(bench, "name", str(bench)), chunk=chunk.id, attempt=chunk.attempt,
+                                  elapsed=time.perf_counter() - start)
+                with lock:
+                    for offset, (item, result) in enumerate(zip(chunk.items, results)):
+                        records[chunk.start + offset] = ShardRecord(chunk.start + offset, item, result, provenance)
+                    pending[0] -= len(chunk.items)
+                    if pending[0] == 0:
+                        done.set()
+
+        threads = [threading.Thread(target=worker, args=(bench,), name="Shard-{}".format(getattr(bench, "name", i)))
+                   for i, bench in enumerate(self.benches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors or not done.is_set():
+            raise ShardError("{} chunks failed, {} items not collected.".format(
+                len(errors), sum(1 for record in records if record is None)))
+
+        per_bench = OrderedDict()
+        for record in records:
+            per_bench[record.provenance["bench"]] = per_bench.get(record.provenance["bench"], 0) + 1
+        logger.info("Sharded %d items over %d benches: %s", len(items), len(self.benches), dict(per_bench))
+        return records
+
+
+def _resolve(func):
+    if isinstance(func, str):
+        module, _, name = func.partition(":")
+        return getattr(importlib.import_module(module), name)
+    return func
+
+
+def _call_in_process(func, bench_state, items):
+    return _resolve(func)(bench_state, items)
+
+
+class ProcessBench:
+    """
+    Run shards of one bench in its own process, for local simulated benches. func(state, items) is sent to
+    the process, so it must be a module level function or its 'module:function' name, not a lambda or closure.
+    """
+    def __init__(self, name: str, func: Union[str, Callable], state=None):
+        if not isinstance(func, str):
+            try:
+                pickle.dumps(func)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                raise TypeError("{!r} can't be sent to a process, use a module level function: {}".format(func, e))
+        self.name = name
+        self.func = func
+        self.state = state
+        self._executor = ProcessPoolExecutor(max_workers=1)
+
+    def __str__(self):
+        return "<{}(name:{})>".format(self.__class__.__name__, self.name)
+
+    def __call__(self, items):
+        return self._executor.submit(_call_in_process, self.func, self.state, items).result()
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def run_process_shard(bench: ProcessBench, items):
+    return bench(items)
+
+
+def save_dataset(records: List[ShardRecord], path: str):
+    with open(path, "w") as f:
+        json.dump([record._asdict() for record in records], f, default=str, indent=1)
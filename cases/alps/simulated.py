@@ -0,0 +1,432 @@
+# coding: utf-8
+
+"""
+Simulated bench devices with configurable latency and synthetic output, for measuring and regression testing
+collection and checking hot paths without ALPS board, rotary, analyzer or RTS simulator.
+"""
+
+import math
+import time
+import random
+import threading
+from typing import Callable, List, Sequence, Tuple
+
+from ngta import TestBench as BaseTestBench
+
+from bench import MeasureTestBench, TestBench
+from device import CachedDeviceAdapter
+from instruments import CachedAnalyzer
+
+TargetSpec = Tuple[float, float, float]     # rng, vel, ang
+
+
+def _wrap_phase(deg):
+    return (deg + 180.0) % 360.0 - 180.0
+
+
+def _in_tolerance(value, expect, tolerance):
+    """Standard tolerance is a signed (lower, upper) offset from expect, a plain number is symmetric."""
+    if isinstance(tolerance, (list, tuple)):
+        lower, upper = tolerance
+    else:
+        lower, upper = -abs(tolerance), abs(tolerance)
+    return expect + lower <= value <= expect + upper
+
+
+class SimTarget:
+    __slots__ = ("rng", "vel", "ang")
+
+    def __init__(self, rng, vel, ang):
+        self.rng = rng
+        self.vel = vel
+        self.ang = ang
+
+    def __repr__(self):
+        return "<SimTarget(rng:{:.2f}, vel:{:.2f}, ang:{:.2f})>".format(self.rng, self.vel, self.ang)
+
+
+class SimFrame:
+    def __init__(self, idx: int, ak: List[SimTarget], bk: List[SimTarget]):
+        self.idx = idx
+        self.ak = ak
+        self.bk = bk
+
+    @property
+    def raw(self):
+        lines = ["FRAME {}".format(self.idx)]
+        for mode in ("bk", "ak"):
+            for target in getattr(self, mode):
+                lines.append("{} rng {:.2f} vel {:.2f} ang {:.2f}".format(mode.upper(), target.rng, target.vel,
+                                                                         target.ang))
+        return "\n".join(lines) + "\n"
+
+    def find_target(self, mode, *, rng, rng_tolerance=0, vel, vel_tolerance=0, ang=None, ang_tolerance=0):
+        for target in getattr(self, mode):
+            if _in_tolerance(target.rng, rng, rng_tolerance) and _in_tolerance(target.vel, vel, vel_tolerance) \
+                    and (ang is None or _in_tolerance(target.ang, ang, ang_tolerance)):
+                return target
+        return None
+
+
+class SimFrames(list):
+    @property
+    def raw(self):
+        return "".join(frame.raw for frame in self)
+
+
+class SimRotary:
+    def __init__(self, speed: float = 30.0, settle: float = 0.0):
+        self.speed = speed
+        self.settle = settle
+        self.x = 0.0
+        self.y = 0.0
+        self.travelled = 0.0
+        self._is_open = False
+
+    def open(self):
+        self._is_open = True
+
+    def close(self):
+        self._is_open = False
+
+    def is_open(self):
+        return self._is_open
+
+    def reset(self):
+        self.goto(x=0, y=0)
+
+    def goto(self, x=0, y=0, **kwargs):
+        travel = max(abs(x - self.x), abs(y - self.y)) / self.speed if self.speed else 0.0
+        time.sleep(travel + self.settle)
+        self.travelled += travel
+        self.x, self.y = x, y
+
+
+class SimAnalyzer:
+    """
+    Max-hold peak converges exponentially to the held tone after every trace reset, nothing shows before the
+    first sweep ends. Sweep time follows sweep_factor * span / rbw^2 unless tau/dead_time are given.
+    """
+    def __init__(self, latency: float = 0.0, tau: float = None, dead_time: float = None,
+                 dbm: float = -20.0, freq_error: float = 2e6, sweep_factor: float = 2.0, min_sweep: float = 0.002):
+        self.latency = latency
+        self.tau = tau
+        self.dead_time = dead_time
+        self.dbm = dbm
+        self.freq_error = freq_error
+        self.sweep_factor = sweep_factor
+        self.min_sweep = min_sweep
+        self.start = 75.5e9
+        self.stop = 78.5e9
+        self.rbw = 1e5
+        self.tone = None
+        self.ncommand = 0
+        self._reset_at = time.monotonic()
+
+    @property
+    def sweep_time(self):
+        return max(self.min_sweep, self.sweep_factor * (self.stop - self.start) / self.rbw ** 2)
+
+    def _call(self):
+        self.ncommand += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def preset(self):
+        self._call()
+
+    def mixer_signal_id(self, *args, **kwargs):
+        self._call()
+
+    def peak_table(self, *args, **kwargs):
+        self._call()
+
+    def frequency(self, start, stop):
+        self._call()
+        self.start, self.stop = (float(v.split()[0]) * 1e9 if isinstance(v, str) else v for v in (start, stop))
+
+    def command(self, cmd, *args, **kwargs):
+        self._call()
+        header, _, value = cmd.strip().partition(" ")
+        if header.upper() in (":SENS:BAND:RES", ":SENSE:BANDWIDTH:RESOLUTION"):
+            self.rbw = float(value)
+        elif header.upper() in (":SENS:BAND:RES?", ":SENSE:BANDWIDTH:RESOLUTION?"):
+            return "{:.6e}".format(self.rbw)
+        elif header.upper() in (":SENS:SWE:TIME?", ":SENSE:SWEEP:TIME?"):
+            return "{:.6e}".format(self.sweep_time)
+        elif header.endswith("?"):
+            return "0"
+
+    def trace(self, mode):
+        self._call()
+        self._reset_at = time.monotonic()
+
+    def get_peak_list(self):
+        self._call()
+        elapsed = time.monotonic() - self._reset_at
+        dead_time = self.dead_time if self.dead_time is not None else self.sweep_time
+        if self.tone is None or elapsed < dead_time or not self.start <= self.tone * 1e9 <= self.stop:
+            return []
+        decay = math.exp(-elapsed / (self.tau if self.tau is not None else self.sweep_time))
+        return [(self.tone * 1e9 + self.freq_error * decay, self.dbm - 10 * decay)]
+
+
+class SimRtsTarget:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.rcs = None
+        self.rng = None
+        self.vel = None
+        self.ang = None
+        self.ncommand = 0
+
+    def _set(self, name, value):
+        self.ncommand += 1
+        if self.latency:
+            time.sleep(self.latency)
+        setattr(self, name, value)
+
+    def set_rcs(self, rcs):
+        self._set("rcs", rcs)
+
+    def set_range(self, rng):
+        self._set("rng", rng)
+
+    def set_speed(self, vel):
+        self._set("vel", vel)
+
+    def set_angle(self, ang):
+        self._set("ang", ang)
+
+
+class SimRtsSimulator:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.is_open = False
+
+    def open(self):
+        time.sleep(self.latency)
+        self.is_open = True
+
+    def setup(self, **kwargs):
+        time.sleep(self.latency)
+
+    def close(self):
+        self.is_open = False
+
+
+class SimSimulators(list):
+    def __init__(self, count: int = 1, latency: float = 0.0):
+        super().__init__(SimRtsSimulator(latency) for _ in range(count))
+        self.latency = latency
+        self.targets = []
+
+    def acquire_target(self):
+        target = SimRtsTarget(self.latency)
+        self.targets.append(target)
+        return target
+
+    def release_target(self, target):
+        self.targets.remove(target)
+
+    @property
+    def ncommand(self):
+        return sum(target.ncommand for target in self.targets)
+
+    def target_specs(self) -> List[TargetSpec]:
+        return [(t.rng, t.vel, t.ang) for t in self.targets if t.rng is not None]
+
+
+class SimDeviceAdapter:
+    """
+    Fake alps.DeviceAdapter: `scan` returns frames tracking given targets with noise and misses, `ant_calib`
+    returns per-channel phases following the rotary angle, radio commands drive the simulated analyzer tone.
+    """
+    def __init__(self, latency: float = 0.0, frame_interval: float = 0.0,
+                 targets: Sequence[TargetSpec] = ((20.0, 0.0, 0.0),), noise: float = 0.1, miss_rate: float = 0.0,
+                 nchannel: int = 8, rng_index: int = 12, seed: int = 0,
+                 rotary: SimRotary = None, analyzer: SimAnalyzer = None, target_specs: Callable = None,
+                 chip_name: str = "alps", chip_rev: str = "MP", sensor_cfg: dict = None, sensor_cfg_dump: bool = True,
+                 broken: bool = False):
+        self.latency = latency
+        self.frame_interval = frame_interval
+        self.targets = list(targets)
+        self.noise = noise
+        self.miss_rate = miss_rate
+        self.nchannel = nchannel
+        self.rng_index = rng_index
+        self.rotary = rotary
+        self.analyzer = analyzer
+        self.target_specs = target_specs
+        self.chip_name = chip_name
+        self.chip_rev = chip_rev
+        self.sensor_cfg = sensor_cfg or dict(fmcw_startfreq=76.0, fmcw_bandwidth=300, track_fps=20,
+                                             tx_groups=[1, 2, 3, 4])
+        self.sensor_cfg_dump = sensor_cfg_dump
+        self.broken = broken
+        self.is_open = False
+        self.ncommand = 0
+        self.tx_phases = {}
+        self.comp = [_wrap_phase(37.0 * ch) for ch in range(nchannel)]
+        self._random = random.Random(seed)
+        self._frame_idx = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.is_open = True
+
+    def try_open(self):
+        self.open()
+
+    def close(self):
+        self.is_open = False
+
+    def get_sensor_cfg(self, name):
+        self.command("sensor_cfg {}".format(name))
+        return self.sensor_cfg[name]
+
+    def command(self, cmd, timeout=None):
+        with self._lock:
+            self.ncommand += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(cmd)
+
+    def command_stream(self, commands, timeout=None):
+        """Commands written back to back, the link round trip is paid once for the whole batch."""
+        with self._lock:
+            self.ncommand += len(commands)
+        if self.latency:
+            time.sleep(self.latency)
+        responses = []
+        for cmd in commands:
+            resp = self._respond(cmd)
+            responses.append(resp if resp.startswith(cmd) else "{}\n{}".format(cmd, resp))
+        return "\n".join(r.rstrip("\n") for r in responses) + "\n"
+
+    def _respond(self, cmd):
+        name, _, args = cmd.strip().partition(" ")
+        args = args.split()
+        if name == "ant_calib":
+            return self._ant_calib(cmd)
+        if name == "sensor_cfg_show":
+            if not self.sensor_cfg_dump:
+                return "{}\nError: unknown command".format(cmd)
+            return "\n".join([cmd] + ["{} = {}".format(k, self._format_cfg(v)) for k, v in self.sensor_cfg.items()])
+        if name == "sensor_cfg" and len(args) == 1:
+            return "{}\n{} = {}".format(cmd, args[0], self._format_cfg(self.sensor_cfg[args[0]]))
+        if name == "radio_txphase" and len(args) == 2:
+            self.tx_phases[args[0]] = int(args[1])
+        elif name == "radio_txphase":
+            return " ".join("CH{}:{}".format(ch, phase) for ch, phase in sorted(self.tx_phases.items()))
+        elif name in ("radio_single_tone", "radio_fmcw_hold") and self.analyzer is not None:
+            self.analyzer.tone = float(args[0])
+            return "locked"
+        return ""
+
+    @staticmethod
+    def _format_cfg(value):
+        return " ".join(str(v) for v in value) if isinstance(value, (list, tuple)) else str(value)
+
+    def _ant_calib(self, cmd, nline=4):
+        x = self.rotary.x if self.rotary else 0.0
+        y = self.rotary.y if self.rotary else 0.0
+        lines = [cmd]
+        for _ in range(nline):
+            phases = [_wrap_phase(ch * 180.0 * (math.sin(math.radians(x)) + math.sin(math.radians(y)))
+                                  + self.comp[ch] + self._random.gauss(0, self.noise))
+                      for ch in range(self.nchannel)]
+            lines.append("rng_index {} range {:.2f} {}".format(
+                self.rng_index, 3.5 + self._random.gauss(0, 0.01), " ".join("{:.4f}".format(p) for p in phases)))
+        return "\n".join(lines) + "\n"
+
+    def scan(self, nframe):
+        if self.broken:
+            raise ConnectionError("Simulated dut link is broken.")
+        if self.latency or self.frame_interval:
+            time.sleep(self.latency + nframe * self.frame_interval)
+        specs = self.target_specs() if self.target_specs else self.targets
+        gauss = self._random.gauss
+        frames = SimFrames()
+        for _ in range(nframe):
+            tracked = [SimTarget(rng + gauss(0, self.noise), vel + gauss(0, self.noise), ang + gauss(0, self.noise))
+                       for rng, vel, ang in specs if self._random.random() >= self.miss_rate]
+            frames.append(SimFrame(self._frame_idx, list(tracked), tracked))
+            self._frame_idx += 1
+        return frames
+
+
+class SimApp:
+    def __init__(self):
+        self.is_open = False
+        self.track_fps = None
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def is_process_running(self):
+        return self.is_open
+
+
+class SimTestBench(TestBench):
+    def __init__(self, name: str = "sim-tb", dut_latency: float = 0.0, frame_interval: float = 0.0,
+                 rot_speed: float = 0.0, rot_settle: float = 0.0, simulator_count: int = 1,
+                 simulator_latency: float = 0.0, targets: Sequence[TargetSpec] = ((20.0, 0.0, 0.0),),
+                 miss_rate: float = 0.0, broken: bool = False, **kwargs):
+        kwargs.setdefault("rts_setups", [{}] * simulator_count)
+        super().__init__(name, **kwargs)
+        self.sim_options = dict(dut_latency=dut_latency, frame_interval=frame_interval, rot_speed=rot_speed,
+                                rot_settle=rot_settle, simulator_count=simulator_count,
+                                simulator_latency=simulator_latency, targets=targets, miss_rate=miss_rate,
+                                broken=broken)
+
+    def _create_devices(self):
+        options = self.sim_options
+        self.simulators = SimSimulators(options["simulator_count"], options["simulator_latency"])
+        self.rot = SimRotary(options["rot_speed"], options["rot_settle"])
+        self.dut = CachedDeviceAdapter(SimDeviceAdapter(
+            latency=options["dut_latency"], frame_interval=options["frame_interval"], targets=options["targets"],
+            miss_rate=options["miss_rate"], rotary=self.rot, broken=options["broken"],
+            target_specs=self.simulators.target_specs if not options["targets"] else None))
+        self.app = SimApp()
+
+
+_process_benches = {}
+
+
+def collect_akbk_shard_in_process(options: dict, positions: list) -> list:
+    """
+    ProcessBench function: collect akbk of positions on a simulated bench living in the worker process,
+    return frame count of every position.
+    """
+    from collect_data import iter_akbk_for_angles
+
+    options = dict(options)
+    nframe = options.pop("nframe", 5)
+    name = options.setdefault("name", "sim-tb")
+    if name not in _process_benches:
+        bench = _process_benches[name] = SimTestBench(**options)
+        bench.on_testrunner_started(None)
+    return [len(frames) for _, frames in iter_akbk_for_angles(positions, nframe, testbench=_process_benches[name])]
+
+
+class SimMeasureTestBench(MeasureTestBench):
+    def __init__(self, dut_latency: float = 0.0, rot_speed: float = 0.0, analyzer_latency: float = 0.0,
+                 analyzer_tau: float = None, with_src: bool = False):
+        BaseTestBench.__init__(self, "SimMeasureTestBench", type='alps', exclusive=True)
+        self.rot = SimRotary(rot_speed)
+        analyzer = SimAnalyzer(analyzer_latency, tau=analyzer_tau)
+        self.analyzer = CachedAnalyzer(analyzer)
+        self.dut = CachedDeviceAdapter(SimDeviceAdapter(dut_latency, rotary=self.rot, analyzer=analyzer))
+        self.src = CachedDeviceAdapter(SimDeviceAdapter(dut_latency)) if with_src else None
+        self.recorder = None
+        self.trace_path = None
@@ -0,0 +1,231 @@
+# coding: utf-8
+
+"""
+Streaming statistics of per-sample results, so testcases keep a compact summary in record extras instead
+of every sample: count/mean/std (Welford), min/max, fixed-bin histogram and P-square quantile estimates.
+Samples are only kept, in a side file of little-endian float64, when samples_path is given.
+"""
+
+import bisect
+import math
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class P2Quantile:
+    """P-square estimate of one quantile with 5 markers (Jain & Chlamtac), constant memory."""
+    def __init__(self, p: float):
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] += d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self) -> float:
+        q = self.heights
+        if not q:
+            return math.nan
+        if len(q) < 5:
+            return q[int(round(self.p * (len(q) - 1)))]
+        return q[2]
+
+
+class StreamingStats:
+    """
+    Feed samples one by one with add, or in blocks with extend. Histogram has `bins` equal bins over
+    hist_range, without a range it is fixed from the first `warmup` samples; samples outside count as
+    underflow/overflow.
+    """
+    def __init__(self, bins: int = 20, hist_range: Tuple[float, float] = None,
+                 quantiles: Sequence[float] = DEFAULT_QUANTILES, warmup: int = 100, samples_path: str = None):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.bins = bins
+        self.edges = np.linspace(hist_range[0], hist_range[1], bins + 1) if hist_range else None
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.warmup = warmup
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+        self.samples_path = samples_path
+        self._warmup_samples = []
+        self._pending = []
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+    def add(self, x: float):
+        x = float(x)
+        if math.isnan(x):
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for quantile in self.quantiles:
+            quantile.add(x)
+        self._bin(np.array([x]))
+        self._keep(x)
+
+    def extend(self, values: Iterable[float]):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        # merge block moments (Chan et al.), same result as adding one by one.
+        n = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        total = self.count + n
+        delta = mean - self.mean
+        self._m2 += m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        for x in values.tolist():
+            for quantile in self.quantiles:
+                quantile.add(x)
+        self._bin(values)
+        self._keep(values)
+
+    def _bin(self, values: np.ndarray):
+        if self.edges is None:
+            self._warmup_samples.extend(values.tolist())
+            if len(self._warmup_samples) < self.warmup:
+                return
+            self._fix_edges()
+            values = np.array(self._warmup_samples)
+            self._warmup_samples = []
+        self.underflow += int((values < self.edges[0]).sum())
+        self.overflow += int((values > self.edges[-1]).sum())
+        self.counts += np.histogram(values, self.edges)[0]
+
+    def _fix_edges(self):
+        lo, hi = min(self._warmup_samples), max(self._warmup_samples)
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        else:
+            # some room for later samples just outside warmup range.
+            margin = (hi - lo) * 0.1
+            lo, hi = lo - margin, hi + margin
+        self.edges = np.linspace(lo, hi, self.bins + 1)
+
+    def _keep(self, values):
+        if not self.samples_path:
+            return
+        if isinstance(values, np.ndarray):
+            self._pending.extend(values.tolist())
+        else:
+            self._pending.append(values)
+        if len(self._pending) >= 4096:
+            self.flush()
+
+    def flush(self):
+        if self.samples_path and self._pending:
+            with open(self.samples_path, "ab") as f:
+                np.asarray(self._pending, dtype="<f8").tofile(f)
+            self._pending = []
+
+    def summary(self) -> dict:
+        """Compact JSON friendly summary, stored in record extras in place of samples."""
+        self.flush()
+        if self.edges is None and self._warmup_samples:
+            self._fix_edges()
+            values = np.array(self._warmup_samples)
+            self._warmup_samples = []
+            self._bin(values)
+        empty = self.count == 0
+        return dict(
+            count=self.count,
+            mean=None if empty else float(self.mean),
+            std=None if self.count < 2 else self.std,
+            min=None if empty else float(self.min),
+            max=None if empty else float(self.max),
+            quantiles={"p{:g}".format(q.p * 100): q.value() for q in self.quantiles} if not empty else {},
+            histogram=dict(edges=self.edges.tolist() if self.edges is not None else [], counts=self.counts.tolist(),
+                           underflow=self.underflow, overflow=self.overflow),
+            samples=self.samples_path,
+        )
+
+
+def load_samples(path: str) -> np.ndarray:
+    return np.fromfile(path, dtype="<f8")
+
+
+def stream_stats(extras: dict, name: str = "data", **options) -> StreamingStats:
+    """
+    Accumulator kept in extras[name] of a testcase record, feed it per sample with add/extend. It is replaced
+    by its summary when testcase stops, pass samples_path to keep all samples in a side file.
+    """
+    value = extras.get(name)
+    if not isinstance(value, StreamingStats):
+        value = extras[name] = StreamingStats(**options)
+    return value
+
+
+def to_summary(value):
+    return value.summary() if isinstance(value, StreamingStats) else value
+
+
+def finalize_extras(extras: dict):
+    """Replace accumulators in record extras by their summaries."""
+    for name, value in list(extras.items()):
+        if isinstance(value, StreamingStats):
+            extras[name] = value.summary()
+
+
+def on_testcase_stopped(event):
+    finalize_extras(event.target.record.extras)
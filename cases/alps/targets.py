@@ -0,0 +1,130 @@
+# coding: utf-8
+
+import itertools
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+import logging
+logger = logging.getLogger(__name__)
+
+# parameter name -> setter on keycom target, in the order they are applied.
+TARGET_SETTERS = OrderedDict([("rcs", "set_rcs"), ("rng", "set_range"), ("vel", "set_speed"), ("ang", "set_angle")])
+
+
+class CommandCounter:
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+
+    def __str__(self):
+        return "sent {}, skipped {} (without state cache {})".format(self.sent, self.skipped, self.sent + self.skipped)
+
+
+class StatefulTarget:
+    """Wrap simulator target, remember applied parameters and only send those that changed."""
+    def __init__(self, target, counter: CommandCounter = None):
+        self._target = target
+        self.counter = counter or CommandCounter()
+        self.state = {}
+
+    def __getattr__(self, name):
+        # any other operation (move, stop...) leaves target in unknown state.
+        attr = getattr(self._target, name)
+        if callable(attr):
+            self.state.clear()
+        return attr
+
+    def __repr__(self):
+        return "<{}({!r}, state:{})>".format(self.__class__.__name__, self._target, self.state)
+
+    @property
+    def target(self):
+        return self._target
+
+    def apply(self, **params):
+        for name, setter in TARGET_SETTERS.items():
+            value = params.get(name)
+            if value is None:
+                continue
+            if self.state.get(name) == value:
+                self.counter.skipped += 1
+                continue
+            try:
+                getattr(self._target, setter)(value)
+            except Exception:
+                self.state.pop(name, None)
+                raise
+            self.state[name] = value
+            self.counter.sent += 1
+
+    def set_rcs(self, rcs):
+        self.apply(rcs=rcs)
+
+    def set_range(self, rng):
+        self.apply(rng=rng)
+
+    def set_speed(self, vel):
+        self.apply(vel=vel)
+
+    def set_angle(self, ang):
+        self.apply(ang=ang)
+
+
+class TargetPool:
+    """Reuse acquired simulator targets across iterations, release them back to simulators on close."""
+    def __init__(self, simulators):
+        self.simulators = simulators
+        self.counter = CommandCounter()
+        self._free = []
+        self._all = []
+
+    def acquire(self) -> StatefulTarget:
+        if self._free:
+            return self._free.pop()
+        target = StatefulTarget(self.simulators.acquire_target(), self.counter)
+        self._all.append(target)
+        return target
+
+    def release(self, target: StatefulTarget):
+        if target not in self._free:
+            self._free.append(target)
+
+    def close(self):
+        logger.info("simulator target commands: %s", self.counter)
+        for target in self._all:
+            self.simulators.release_target(target.target)
+        self._free.clear()
+        self._all.clear()
+
+
+def count_target_commands(params_list: Iterable[dict]) -> int:
+    """Count setter commands needed with state cache for given iteration order."""
+    count = 0
+    state = {}
+    for params in params_list:
+        for name in TARGET_SETTERS:
+            if name in params and state.get(name) != params[name]:
+                count += 1
+                state[name] = params[name]
+    return count
+
+
+def order_iterations(iterations: Dict[str, Iterable], costs: Dict[str, float] = None) -> List[dict]:
+    """
+    Order iteration space so consecutive iterations differ by exactly one parameter (reflected gray code over
+    the grid). Parameters with higher cost, e.g. set_range needing longer settling, change least often.
+    """
+    costs = costs or {}
+    names = sorted(iterations, key=lambda name: -costs.get(name, 1.0))
+    values = [list(iterations[name]) for name in names]
+
+    result = []
+    for index in itertools.product(*(range(len(v)) for v in values)):
+        digits = []
+        flip = False
+        for level, i in enumerate(index):
+            digit = len(values[level]) - 1 - i if flip else i
+            digits.append(digit)
+            flip ^= bool(digit % 2)
+        result.append({name: values[level][digit] for level, (name, digit) in enumerate(zip(names, digits))})
+    return result
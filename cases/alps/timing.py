@@ -0,0 +1,184 @@
+# coding: utf-8
+
+import os
+import json
+import time
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Iterable
+
+import logging
+logger = logging.getLogger(__name__)
+
+# bench device attribute -> operations timed on it.
+BENCH_OPERATIONS = OrderedDict([
+    ("dut", ("command", "send_batch", "scan")),
+    ("src", ("command", "send_batch", "scan")),
+    ("rot", ("goto", "reset")),
+    ("analyzer", ("command", "preset", "mixer_signal_id", "trace", "peak_table", "frequency", "get_peak_list")),
+])
+SIMULATOR_OPERATIONS = ("open", "setup")
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.add(self.name, self.start, time.perf_counter() - self.start)
+
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Collect timing spans of bench operations: per-testcase count/total/min/max/avg per operation, and optionally
+    every span for a chrome trace (chrome://tracing, perfetto) of the whole run. When disabled, span returns
+    one shared no-op context manager.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.keep_events = False
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+        self._events = []
+        self._origin = time.perf_counter()
+
+    def enable(self, keep_events: bool = False):
+        self.enabled = True
+        self.keep_events = keep_events
+
+    def disable(self):
+        self.enabled = False
+
+    def add(self, name, start, elapsed):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                self._stats[name] = [1, elapsed, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                stat[2] = min(stat[2], elapsed)
+                stat[3] = max(stat[3], elapsed)
+            if self.keep_events:
+                self._events.append((name, start - self._origin, elapsed, threading.get_ident()))
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def wrap(self, func, name):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, start, time.perf_counter() - start)
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self._stats = OrderedDict()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return OrderedDict(
+                (name, dict(count=count, total=total, min=min_, max=max_, avg=total / count))
+                for name, (count, total, min_, max_) in self._stats.items()
+            )
+
+    def chrome_events(self) -> list:
+        with self._lock:
+            return [dict(name=name, cat=name.split(".")[0], ph="X", pid=os.getpid(), tid=tid,
+                         ts=round((start + self._origin - _ORIGIN) * 1e6, 3), dur=round(elapsed * 1e6, 3))
+                    for name, start, elapsed, tid in self._events]
+
+
+_ORIGIN = time.perf_counter()
+
+# testcase work, reset per testcase and reported in its record.
+tracer = Tracer()
+# uploader and background writer, they run across testcases so are kept out of testcase timing.
+background = Tracer()
+
+_current = ContextVar("tracer")
+
+
+def current() -> Tracer:
+    """Tracer of the running thread, background threads bind their own, others time testcase work."""
+    return _current.get(tracer)
+
+
+def bind(t: Tracer):
+    """Make spans of the calling thread go to t, call it first thing in a background thread."""
+    _current.set(t)
+
+
+def span(name):
+    return current().span(name)
+
+
+def enable(keep_events: bool = False):
+    tracer.enable(keep_events)
+    background.enable(keep_events)
+
+
+def export_chrome_trace(path):
+    events = tracer.chrome_events() + background.chrome_events()
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    logger.info("Export %d timing spans to %s", len(events), path)
+
+
+def log_background():
+    for name, stat in background.summary().items():
+        logger.info("background %-20s count %6d, total %9.3fs, avg %8.4fs", name, stat["count"], stat["total"],
+                    stat["avg"])
+
+
+def sleep(seconds):
+    with span("sleep"):
+        time.sleep(seconds)
+
+
+def instrument(obj, operations: Iterable[str], prefix: str):
+    """Time given methods of one device instance, spans are named '<prefix>.<operation>'."""
+    for operation in operations:
+        func = getattr(obj, operation, None)
+        if callable(func) and not getattr(func, "_timed", False):
+            wrapper = tracer.wrap(func, "{}.{}".format(prefix, operation))
+            wrapper._timed = True
+            setattr(obj, operation, wrapper)
+    return obj
+
+
+def instrument_bench(bench):
+    for name, operations in BENCH_OPERATIONS.items():
+        device = getattr(bench, name, None)
+        if device is not None:
+            instrument(device, operations, name)
+    for index, simulator in enumerate(getattr(bench, "_simulators", None) or []):
+        instrument(simulator, SIMULATOR_OPERATIONS, "simulator{}".format(index))
+
+
+def on_testcase_started(event):
+    if tracer.enabled:
+        tracer.reset()
+
+
+def on_testcase_stopped(event):
+    if tracer.enabled:
+        event.target.record.extras["timing"] = tracer.summary()
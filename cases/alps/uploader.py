@@ -0,0 +1,248 @@
+# coding: utf-8
+
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import timing
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "loch_spool")
+LOCK_NAME = ".lock"
+
+SpoolItem = namedtuple("SpoolItem", ["path", "test_type", "data"])
+
+
+class UploadError(Exception):
+    pass
+
+
+def _try_lock(path):
+    """Open and lock path without blocking, return the open file or None when another process holds it."""
+    f = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _unlock(f):
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.close()
+
+
+class HistoryUploader:
+    """
+    Upload test histories to loch server on a background thread with a pooled keep-alive session.
+    Every history is spooled to disk first and only removed after server accepted it, so results survive
+    server outage and are uploaded again by next flush or next run.
+
+    Every uploader spools to its own locked directory under spool_dir, spool directories left by runners
+    that are gone are taken over on start, so concurrent runners never upload the same history.
+    """
+    _STOP = object()
+
+    def __init__(self, url: str, spool_dir: str = DEFAULT_SPOOL_DIR, batch_size: int = 1,
+                 retries: int = 5, backoff: float = 1.0, timeout: float = 10):
+        self.url = url.rstrip("/")
+        self.spool_root = spool_dir
+        self.spool_dir = os.path.join(spool_dir, "{}-{}".format(os.getpid(), uuid.uuid4().hex[:8]))
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._failed = []
+        self._deadline = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._lock = _try_lock(os.path.join(self.spool_dir, LOCK_NAME))
+
+    def start(self):
+        for item in self._load_spool():
+            self._queue.put(item)
+        self._thread = threading.Thread(target=self._run, name="HistoryUploader", daemon=True)
+        self._thread.start()
+
+    def submit(self, test_type: str, data: dict):
+        item = self._spool(test_type, data)
+        if self._thread is None:
+            self._upload([item])
+        else:
+            self._queue.put(item)
+
+    def close(self, timeout: float = 30):
+        """
+        Upload what is queued and retry failed histories once, for at most timeout seconds.
+        Histories not uploaded by then stay in spool for next run.
+        """
+        self._deadline = time.monotonic() + timeout
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Uploading isn't finished in %ss, leave the rest in spool.", timeout)
+            self._thread = None
+        pending = [name for name in os.listdir(self.spool_dir) if name.endswith(".json")]
+        if pending:
+            logger.warning("%d histories are left in spool %s, will be uploaded next time.",
+                           len(pending), self.spool_dir)
+        if self._lock is not None:
+            _unlock(self._lock)
+            self._lock = None
+        if not pending:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        self.session.close()
+
+    def _remaining(self):
+        return None if self._deadline is None else self._deadline - time.monotonic()
+
+    def _spool(self, test_type, data) -> SpoolItem:
+        name = "{}-{}-{}.json".format(test_type, time.strftime("%Y%m%d%H%M%S"), uuid.uuid4().hex[:8])
+        path = os.path.join(self.spool_dir, name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(dict(test_type=test_type, data=data), f)
+        os.replace(path + ".tmp", path)
+        return SpoolItem(path, test_type, data)
+
+    def _adopt(self, directory):
+        """Move spooled histories of directory into ours, a rename can only succeed for one runner."""
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                try:
+                    os.rename(os.path.join(directory, name), os.path.join(self.spool_dir, name))
+                except OSError:
+                    pass
+
+    def _adopt_orphans(self):
+        # histories spooled directly in root by older versions.
+        self._adopt(self.spool_root)
+        for name in os.listdir(self.spool_root):
+            directory = os.path.join(self.spool_root, name)
+            if directory == self.spool_dir or not os.path.isdir(directory):
+                continue
+            lock = _try_lock(os.path.join(directory, LOCK_NAME))
+            if lock is None:
+                continue
+            try:
+                self._adopt(directory)
+            finally:
+                _unlock(lock)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _load_spool(self):
+        self._adopt_orphans()
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path) as f:
+                    d = json.load(f)
+            except (OSError, ValueError):
+                logger.exception("Skip broken spool file: %s", path)
+                continue
+            yield SpoolItem(path, d["test_type"], d["data"])
+
+    def _upload_batch(self, batch):
+        for test_type in dict.fromkeys(item.test_type for item in batch):
+            items = [item for item in batch if item.test_type == test_type]
+            try:
+                self._upload(items)
+            except UploadError as e:
+                logger.warning("%s Keep %d %s histories in spool.", e, len(items), test_type)
+                self._failed.extend(items)
+            except Exception:
+                logger.exception("Upload %s histories failed, keep them in spool.", test_type)
+                self._failed.extend(items)
+
+    def _run(self):
+        timing.bind(timing.background)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._upload_batch(batch)
+
+        # one more try for histories failed during run, bounded by close deadline.
+        failed, self._failed = self._failed, []
+        for i in range(0, len(failed), self.batch_size):
+            self._upload_batch(failed[i:i + self.batch_size])
+
+    def _upload(self, items):
+        test_type = items[0].test_type
+        url = "{}/loch/api/histories/{}".format(self.url, test_type)
+        payload = items[0].data if len(items) == 1 else [item.data for item in items]
+
+        for attempt in range(self.retries):
+            remaining = self._remaining()
+            if remaining is not None and remaining <= 0:
+                raise UploadError("Upload to {} is out of close timeout.".format(url))
+            try:
+                with timing.background.span("loch.upload"):
+                    resp = self.session.post(url, json=payload, timeout=min(self.timeout, remaining or self.timeout))
+                if resp.ok:
+                    break
+                logger.warning("Upload to %s failed with status %s.", url, resp.status_code)
+            except requests.RequestException as e:
+                logger.warning("Upload to %s failed: %s", url, e)
+            if attempt + 1 < self.retries:
+                delay = self.backoff * 2 ** attempt
+                remaining = self._remaining()
+                time.sleep(delay if remaining is None else max(0.0, min(delay, remaining)))
+        else:
+            raise UploadError('Upload data to server failed.')
+
+        # any 2xx means server took every history of the request, keeping one would upload it twice.
+        try:
+            results = resp.json()
+        except ValueError:
+            results = None
+        if len(items) == 1 and isinstance(results, dict):
+            results = [results]
+        if not isinstance(results, list) or len(results) != len(items):
+            logger.warning("Server accepted %d %s histories with a reply not listing them: %.200r", len(items),
+                           test_type, resp.text)
+            results = [None] * len(items)
+        for item, result in zip(items, results):
+            if isinstance(result, dict) and "id" in result:
+                print('*** Access {}/history/{}/{} to view result'.format(self.url, test_type, result['id']))
+            os.remove(item.path)